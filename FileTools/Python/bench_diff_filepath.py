@@ -0,0 +1,329 @@
+#!/usr/bin/python3
+# -*- coding: UTF-8 -*-
+
+########################################################################################################################
+#   author: zhanghong.personal@outlook.com
+#  version: 1.2
+#    usage:
+#      bench_diff_filepath.py -d <work folder> [-o <result json>] [-layouts tiny,huge,deep,filter] [-scale <float>] [-seed N] [-workers N] [-args "<diff_filepath.py args>"]
+# describe: Generate reproducible synthetic trees and benchmark create/compare modes of diff_filepath.py
+#
+# release nodes:
+#   2026.10.18 - first release
+#   2026.10.18 - Save phase timing reported by diff_filepath.py -stats
+#   2026.10.18 - Record failed runs in the result instead of stopping, exit with 1 if any run failed
+########################################################################################################################
+
+import os
+import sys
+import json
+import time
+import random
+import shlex
+import platform
+import subprocess
+
+# 被测试的脚本, 和当前脚本放在同一个文件夹中
+DIFF_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "diff_filepath.py")
+sys.path.insert(0, os.path.dirname(DIFF_SCRIPT))
+import diff_filepath
+
+# 支持的目录结构, scale 为 1 时的参数
+LAYOUTS = {
+    # 大量的小文件
+    "tiny": {"folders": 200, "files": 100, "min_size": 0, "max_size": 4096},
+    # 少量的大文件
+    "huge": {"folders": 1, "files": 4, "min_size": 256 * 1024 * 1024, "max_size": 256 * 1024 * 1024},
+    # 很深的文件夹层级
+    "deep": {"depth": 64, "branches": 2, "files": 8, "min_size": 0, "max_size": 16 * 1024},
+    # 大部分文件会被 -not-filter 排除
+    "filter": {"folders": 50, "files": 20, "excluded": ["node_modules", ".git", "__pycache__"], "excluded_files": 200, "min_size": 0, "max_size": 8192},
+}
+# filter 结构对应的过滤条件
+FILTER_ARGS = ["-not-filter", r"node_modules|\.git|__pycache__"]
+
+
+def check_args(input_args):
+    """
+    检查输入的参数
+    :param input_args:
+    :return: dict
+    """
+    args_dict = {"mode": "bench",
+                 "args_dst_folder": "Null",
+                 "args_output": "Null",
+                 "args_layouts": list(LAYOUTS),
+                 "args_scale": 1.0,
+                 "args_seed": 0,
+                 "args_workers": 1,
+                 "args_extra": []}
+
+    if len(input_args) <= 1:
+        return {"mode": "help"}
+    for args in input_args:
+        if args in ["-h", "help"]:
+            return {"mode": "help"}
+        try:
+            if args == "-d":
+                args_dict["args_dst_folder"] = input_args[input_args.index("-d") + 1]
+            elif args == "-o":
+                args_dict["args_output"] = input_args[input_args.index("-o") + 1]
+            elif args == "-layouts":
+                args_dict["args_layouts"] = input_args[input_args.index("-layouts") + 1].split(",")
+            elif args == "-scale":
+                args_dict["args_scale"] = float(input_args[input_args.index("-scale") + 1])
+            elif args == "-seed":
+                args_dict["args_seed"] = int(input_args[input_args.index("-seed") + 1])
+            elif args == "-workers":
+                args_dict["args_workers"] = int(input_args[input_args.index("-workers") + 1])
+            elif args == "-args":
+                args_dict["args_extra"] = shlex.split(input_args[input_args.index("-args") + 1])
+        except:
+            return {"mode": "help"}
+
+    if args_dict.get("args_dst_folder") == "Null" or any(x not in LAYOUTS for x in args_dict.get("args_layouts")):
+        return {"mode": "help"}
+    return args_dict
+
+
+def write_file(rnd, filepath, size):
+    """
+    写入指定大小的随机内容, 大文件分块写入
+    :param rnd: random.Random
+    :param filepath:
+    :param size:
+    :return:
+    """
+    with open(filepath, "wb") as f:
+        while size > 0:
+            chunk = min(size, diff_filepath.BLOCK_SIZE)
+            f.write(rnd.randbytes(chunk))
+            size -= chunk
+
+
+def generate_layout(layout, folder, scale, seed):
+    """
+    生成指定结构的文件夹, 相同的参数总是生成相同的内容
+    :param layout: LAYOUTS 中的名称
+    :param folder: 生成的文件夹
+    :param scale: 文件数量的倍数, huge 结构则是文件大小的倍数
+    :param seed: 随机数种子
+    :return:
+    """
+    conf = LAYOUTS.get(layout)
+    rnd = random.Random("{}-{}".format(layout, seed))
+    os.makedirs(folder)
+
+    def rand_size():
+        return rnd.randint(conf.get("min_size"), conf.get("max_size"))
+
+    if layout == "huge":
+        for i in range(conf.get("files")):
+            write_file(rnd, os.path.join(folder, "file_{}.bin".format(i)), int(rand_size() * scale))
+    elif layout == "deep":
+        # 每一层有 branches 个子文件夹, 只有第一个子文件夹继续向下延伸
+        current = folder
+        for level in range(max(1, int(conf.get("depth") * scale))):
+            for branch in range(conf.get("branches")):
+                os.makedirs(os.path.join(current, "b{}".format(branch)))
+                for i in range(conf.get("files")):
+                    write_file(rnd, os.path.join(current, "b{}".format(branch), "file_{}.dat".format(i)), rand_size())
+            current = os.path.join(current, "b0")
+    else:
+        for d in range(max(1, int(conf.get("folders") * scale))):
+            subfolder = os.path.join(folder, "d{:05d}".format(d))
+            os.makedirs(subfolder)
+            for i in range(conf.get("files")):
+                write_file(rnd, os.path.join(subfolder, "file_{}.txt".format(i)), rand_size())
+            for excluded in conf.get("excluded", []):
+                os.makedirs(os.path.join(subfolder, excluded))
+                for i in range(conf.get("excluded_files")):
+                    write_file(rnd, os.path.join(subfolder, excluded, "file_{}.js".format(i)), rand_size())
+
+
+def prepare_layout(layout, work_folder, scale, seed):
+    """
+    准备测试用的文件夹, 参数一致时复用已经生成的文件夹
+    :param layout:
+    :param work_folder:
+    :param scale:
+    :param seed:
+    :return: str, 生成的文件夹
+    """
+    folder = os.path.join(work_folder, layout)
+    marker = os.path.join(work_folder, layout + ".json")
+    params = {"layout": layout, "scale": scale, "seed": seed, "conf": LAYOUTS.get(layout)}
+    if os.path.exists(marker) and os.path.isdir(folder):
+        with open(marker, "r") as f:
+            if json.load(f) == params:
+                return folder
+    if os.path.isdir(folder):
+        for root, dirs, files in os.walk(folder, topdown=False):
+            for file in files:
+                os.remove(os.path.join(root, file))
+            for d in dirs:
+                os.rmdir(os.path.join(root, d))
+        os.rmdir(folder)
+    print("[INFO] Generating {} layout in {}".format(layout, folder))
+    generate_layout(layout, folder, scale, seed)
+    with open(marker, "w") as f:
+        json.dump(params, f)
+    return folder
+
+
+def tree_stats(folder, filters):
+    """
+    统计会被计算 hash 的文件数量和大小, 同时记录遍历所需的时间
+    :param folder:
+    :param filters: diff_filepath.compile_filters 返回的过滤条件
+    :return: dict, keys: files / bytes / walk_seconds
+    """
+    files = 0
+    size = 0
+    start = time.perf_counter()
+    for filepath, st in diff_filepath.walk_files(folder, filters):
+        files += 1
+        size += st.st_size if st is not None else 0
+    return {"files": files, "bytes": size, "walk_seconds": time.perf_counter() - start}
+
+
+def run_diff(args):
+    """
+    在子进程中运行 diff_filepath.py, 并获取运行时间和内存峰值
+    :param args: diff_filepath.py 的参数
+    :return: dict, keys: seconds / peak_rss_kb / returncode
+    """
+    start = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, DIFF_SCRIPT] + args, stdout=subprocess.DEVNULL)
+    # os.wait4 可以获取单个子进程的资源使用情况, ru_maxrss 在 Linux 中的单位是 KB
+    if hasattr(os, "wait4"):
+        _, status, usage = os.wait4(proc.pid, 0)
+        proc.returncode = os.waitstatus_to_exitcode(status)
+        peak_rss_kb = usage.ru_maxrss
+    else:
+        proc.wait()
+        peak_rss_kb = None
+    return {"seconds": time.perf_counter() - start, "peak_rss_kb": peak_rss_kb, "returncode": proc.returncode}
+
+
+def bench_layout(layout, folder, work_folder, workers, extra_args):
+    """
+    对指定的文件夹依次运行 create 和 compare 模式
+    :param layout:
+    :param folder:
+    :param work_folder:
+    :param workers:
+    :param extra_args: 额外传递给 diff_filepath.py 的参数
+    :return: dict
+    """
+    dbname = os.path.join(work_folder, layout + ".db")
+    common_args = ["-d", folder, "-workers", str(workers)] + extra_args
+    if layout == "filter":
+        common_args += FILTER_ARGS
+        filters = diff_filepath.compile_filters(".*", FILTER_ARGS[1])
+    else:
+        filters = diff_filepath.compile_filters(".*", None)
+
+    stats = tree_stats(folder, filters)
+    result = {"files": stats.get("files"), "bytes": stats.get("bytes"), "walk_seconds": round(stats.get("walk_seconds"), 4)}
+    for mode, mode_args in [("create", ["-o", dbname]), ("compare", ["-db", dbname])]:
+        stats_file = os.path.join(work_folder, "{}_{}_stats.json".format(layout, mode))
+        # 删除上一次的统计结果, 避免运行失败时读到旧的数据
+        if os.path.exists(stats_file):
+            os.remove(stats_file)
+        # create 失败时没有可以比对的数据库
+        if mode == "compare" and result.get("create").get("status") == "failed":
+            result[mode] = {"status": "skipped"}
+            continue
+        run = run_diff(common_args + mode_args + ["-stats", stats_file])
+        seconds = run.get("seconds")
+        # 没有写入统计结果同样视为失败
+        if run.get("returncode") != 0 or not os.path.exists(stats_file):
+            print("[ERROR] {} {} failed, return code is {}, stats file saved: {}".format(layout, mode, run.get("returncode"), os.path.exists(stats_file)))
+            result[mode] = {"status": "failed", "seconds": round(seconds, 4), "peak_rss_kb": run.get("peak_rss_kb"), "returncode": run.get("returncode")}
+            continue
+        with open(stats_file, "r") as f:
+            scan = json.load(f)
+        result[mode] = {
+            "status": "passed",
+            "seconds": round(seconds, 4),
+            # 总时间减去遍历的时间, 近似为计算 hash 和写入数据库的时间
+            "hash_seconds": round(max(seconds - stats.get("walk_seconds"), 0.0), 4),
+            "files_per_sec": round(stats.get("files") / seconds, 2) if seconds > 0 else None,
+            "mb_per_sec": round(stats.get("bytes") / 1024 / 1024 / seconds, 2) if seconds > 0 else None,
+            "peak_rss_kb": run.get("peak_rss_kb"),
+            "returncode": run.get("returncode"),
+            # diff_filepath.py 内部统计的各阶段耗时, 多线程时 read/hash 为所有线程的累加值
+            "phase_seconds": scan.get("phase_seconds"),
+            "slowest_files": scan.get("slowest_files")[:5],
+        }
+        print("[INFO] {:<7} {:<7} {:>10} files {:>10.2f} files/s {:>10.2f} MB/s {:>10} KB RSS".format(
+            layout, mode, stats.get("files"), result[mode].get("files_per_sec") or 0.0,
+            result[mode].get("mb_per_sec") or 0.0, result[mode].get("peak_rss_kb")))
+    return result
+
+
+def git_commit():
+    """
+    获取当前的 git commit, 用于对比不同版本的测试结果
+    :return: str or None
+    """
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=os.path.dirname(DIFF_SCRIPT),
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return None
+
+
+def run_bench(args_dict):
+    """
+    生成测试用的文件夹并运行测试, 结果保存为 JSON
+    :param args_dict:
+    :return: bool, 所有运行是否成功
+    """
+    work_folder = os.path.abspath(args_dict.get("args_dst_folder"))
+    os.makedirs(work_folder, exist_ok=True)
+    results = {
+        "commit": git_commit(),
+        "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "scale": args_dict.get("args_scale"),
+        "seed": args_dict.get("args_seed"),
+        "workers": args_dict.get("args_workers"),
+        "extra_args": args_dict.get("args_extra"),
+        "layouts": {},
+    }
+    for layout in args_dict.get("args_layouts"):
+        folder = prepare_layout(layout, work_folder, args_dict.get("args_scale"), args_dict.get("args_seed"))
+        results["layouts"][layout] = bench_layout(layout, folder, work_folder, args_dict.get("args_workers"), args_dict.get("args_extra"))
+
+    output = args_dict.get("args_output")
+    if output == "Null":
+        output = os.path.join(work_folder, "bench_{}.json".format(time.strftime("%Y%m%d_%H%M%S")))
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print("[INFO] Benchmark result is saved to: {}".format(os.path.abspath(output)))
+    return all(result.get(mode).get("status") == "passed" for result in results["layouts"].values() for mode in ["create", "compare"])
+
+
+if __name__ == "__main__":
+    checked = check_args(sys.argv)
+    if checked.get("mode") == "help":
+        print(
+            "\n",
+            "Usage:\n",
+            "   bench_diff_filepath.py -d <work folder> [-o <result json>] [-layouts tiny,huge,deep,filter] [-scale <float>] [-seed N] [-workers N] [-args \"<diff_filepath.py args>\"]\n",
+            "\n",
+            "args:\n",
+            "# -d            Folder used to save synthetic trees and databases, trees are reused if parameters are not changed\n",
+            "# -o            Save benchmark result to this JSON file, default is <work folder>/bench_<time>.json\n",
+            "# -layouts      Layouts to test, default is tiny,huge,deep,filter\n",
+            "# -scale        Multiplier of file count (file size for huge layout), default is 1\n",
+            "# -seed         Random seed of synthetic trees, default is 0\n",
+            "# -workers      Passed to diff_filepath.py -workers, default is 1\n",
+            "# -args         Extra args passed to diff_filepath.py, like \"-algo blake2b\"\n",
+        )
+    elif not run_bench(checked):
+        sys.exit(1)
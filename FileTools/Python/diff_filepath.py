@@ -3,24 +3,71 @@
 
 ########################################################################################################################
 #   author: zhanghong.personal@outlook.com
-#  version: 1.1
+#  version: 2.7
 #    usage:
 #    - create comparedb:
-#      diff_filepath.py -d <file/folder path>  -o <database name> [-filter <Regular Exp>] [-not-filter <Regular Exp>] [-debug True]
+#      diff_filepath.py -d <file/folder path>  -o <database name> [-filter <Regular Exp>] [-not-filter <Regular Exp>] [-workers N] [-algo <hash name>] [-block-size <bytes>] [-incremental True] [-verify-sample <rate>] [-skip-symlinks True] [-one-fs True] [-progress <seconds>] [-precount True] [-stats <json file>] [-debug True]
 #    - compare filepath:
-#      diff_filepath.py -d <file/folder path> -db <database file> [-filter <Regular Exp>] [-not-filter <Regular Exp>] [-debug True]
+#      diff_filepath.py -d <file/folder path> -db <database file> [-filter <Regular Exp>] [-not-filter <Regular Exp>] [-workers N] [-block-size <bytes>] [-incremental True] [-verify-sample <rate>] [-skip-symlinks True] [-one-fs True] [-fast True] [-strict True] [-format text|jsonl|csv] [-report <file>] [-progress <seconds>] [-precount True] [-stats <json file>] [-debug True]
+#    - compare two databases:
+#      diff_filepath.py -db <database file> -db2 <database file> [-format text|jsonl|csv] [-report <file>] [-debug True]
+#    - find duplicate files:
+#      diff_filepath.py -d <file/folder path> -dupes True [-db <database file>] [-filter <Regular Exp>] [-not-filter <Regular Exp>] [-workers N] [-algo <hash name>] [-format text|jsonl|csv] [-report <file>]
+#    - migrate legacy pickle database:
+#      diff_filepath.py -migrate <pickle database> -o <database name> -d <root path>
 # describe: Find different files path in a specified folder
 #
 # release nodes:
 #   2022.02.05 - first release
 #   2022.02.06 - Add the -d/-debug args, fix some bugs
+#   2026.10.18 - Add the -workers args, calculate file hash in a bounded thread pool
+#   2026.10.18 - Add the -algo/-block-size args, hash files by chunks
+#   2026.10.18 - Save size/mtime/inode in database, add the -incremental/-verify-sample args
+#   2026.10.18 - Use an indexed SQLite database with root-relative paths, add the -migrate args
+#   2026.10.18 - Report added/deleted/modified/unreadable files in compare mode, add the -format/-report args
+#   2026.10.18 - Walk folders by os.scandir, prune excluded folders, add the -skip-symlinks/-one-fs args
+#   2026.10.18 - Save sampled block digest in database, add the -fast/-strict args for tiered compare
+#   2026.10.18 - Add phase timing, add the -progress/-precount/-stats args
+#   2026.10.18 - Add the -dupes args to find duplicate files by size/sampled blocks/full hash, hard links are skipped
+#   2026.10.18 - Save per-folder digests in database, add the -db2 args to compare two databases by subtrees
+#   2026.10.18 - Save paths as UTF-8 bytes in database, file names that can't be decoded are supported
 ########################################################################################################################
 
 import os
 import re
 import sys
+import csv
+import json
+import time
+import heapq
 import pickle
+import random
+import sqlite3
 import hashlib
+from collections import deque
+from urllib.request import pathname2url
+from concurrent.futures import ThreadPoolExecutor
+
+# 数据库的版本, 保存在 SQLite 的 user_version 中, 版本不一致的数据库需要重新生成
+DB_VERSION = 1
+# SQLite 数据库文件的文件头, 用于区分旧版本的 pickle 数据库
+SQLITE_HEADER = b"SQLite format 3\x00"
+# 每积累多少条记录写入一次数据库
+DB_BATCH_SIZE = 1000
+# 比对结果支持的输出格式
+REPORT_FORMATS = ["text", "jsonl", "csv"]
+# 比对结果输出时的缓冲区大小
+REPORT_BUFFER_SIZE = 1024 * 1024
+# 统计耗时的阶段
+SCAN_PHASES = ["walk", "stat", "read", "hash", "db"]
+# 统计结果中保留的最慢的文件数量
+SLOWEST_FILES = 20
+# 默认的 hash 算法
+DEFAULT_ALGO = "sha1"
+# 每次读取的数据块大小
+BLOCK_SIZE = 1024 * 1024
+# 快速比对时, 读取文件头部/中间/尾部的数据块大小
+SAMPLE_BLOCK_SIZE = 64 * 1024
 
 
 def check_args(input_args):
@@ -30,11 +77,28 @@ def check_args(input_args):
     :return: dict, values: compare_dict / create_dict / help_dict
     """
     args_db = "Null"
+    args_db2 = "Null"
+    args_migrate = "Null"
     args_filter = ".*"
     args_not_filter = None
     args_output = "Null"
     args_dst_folder = "Null"
     args_debug = False
+    args_workers = 1
+    args_algo = DEFAULT_ALGO
+    args_block_size = BLOCK_SIZE
+    args_incremental = False
+    args_verify_sample = 0.0
+    args_skip_symlinks = False
+    args_one_fs = False
+    args_fast = False
+    args_strict = False
+    args_format = "text"
+    args_report = "Null"
+    args_progress = 0.0
+    args_precount = False
+    args_stats = "Null"
+    args_dupes = False
 
     if len(input_args) <= 1:
         return {"mode": "help"}
@@ -52,6 +116,16 @@ def check_args(input_args):
                     args_db = input_args[input_args.index("-db") + 1]
                 except:
                     return {"mode": "help"}
+            elif args == "-db2":
+                try:
+                    args_db2 = input_args[input_args.index("-db2") + 1]
+                except:
+                    return {"mode": "help"}
+            elif args == "-migrate":
+                try:
+                    args_migrate = input_args[input_args.index("-migrate") + 1]
+                except:
+                    return {"mode": "help"}
             elif args == "-o":
                 try:
                     args_output = input_args[input_args.index("-o") + 1]
@@ -72,14 +146,144 @@ def check_args(input_args):
                     args_not_filter = input_args[input_args.index("-not-filter") + 1]
                 except:
                     return {"mode": "help"}
+            elif args == "-workers":
+                try:
+                    args_workers = int(input_args[input_args.index("-workers") + 1])
+                except:
+                    return {"mode": "help"}
+            elif args == "-algo":
+                try:
+                    args_algo = input_args[input_args.index("-algo") + 1].lower()
+                    # shake 系列算法需要指定输出长度, 不支持
+                    if args_algo not in hashlib.algorithms_available or args_algo.startswith("shake"):
+                        return {"mode": "help"}
+                except:
+                    return {"mode": "help"}
+            elif args == "-block-size":
+                try:
+                    args_block_size = int(input_args[input_args.index("-block-size") + 1])
+                    if args_block_size <= 0:
+                        return {"mode": "help"}
+                except:
+                    return {"mode": "help"}
+            elif args == "-incremental":
+                try:
+                    args_incremental = input_args[input_args.index("-incremental") + 1]
+                except:
+                    return {"mode": "help"}
+            elif args == "-verify-sample":
+                try:
+                    args_verify_sample = float(input_args[input_args.index("-verify-sample") + 1])
+                    if not 0.0 <= args_verify_sample <= 1.0:
+                        return {"mode": "help"}
+                except:
+                    return {"mode": "help"}
+            elif args == "-skip-symlinks":
+                try:
+                    args_skip_symlinks = input_args[input_args.index("-skip-symlinks") + 1]
+                except:
+                    return {"mode": "help"}
+            elif args == "-one-fs":
+                try:
+                    args_one_fs = input_args[input_args.index("-one-fs") + 1]
+                except:
+                    return {"mode": "help"}
+            elif args == "-fast":
+                try:
+                    args_fast = input_args[input_args.index("-fast") + 1]
+                except:
+                    return {"mode": "help"}
+            elif args == "-strict":
+                try:
+                    args_strict = input_args[input_args.index("-strict") + 1]
+                except:
+                    return {"mode": "help"}
+            elif args == "-format":
+                try:
+                    args_format = input_args[input_args.index("-format") + 1].lower()
+                    if args_format not in REPORT_FORMATS:
+                        return {"mode": "help"}
+                except:
+                    return {"mode": "help"}
+            elif args == "-report":
+                try:
+                    args_report = input_args[input_args.index("-report") + 1]
+                except:
+                    return {"mode": "help"}
+            elif args == "-progress":
+                try:
+                    args_progress = float(input_args[input_args.index("-progress") + 1])
+                except:
+                    return {"mode": "help"}
+            elif args == "-precount":
+                try:
+                    args_precount = input_args[input_args.index("-precount") + 1]
+                except:
+                    return {"mode": "help"}
+            elif args == "-dupes":
+                try:
+                    args_dupes = input_args[input_args.index("-dupes") + 1]
+                except:
+                    return {"mode": "help"}
+            elif args == "-stats":
+                try:
+                    args_stats = input_args[input_args.index("-stats") + 1]
+                except:
+                    return {"mode": "help"}
 
+    # 指定了 -migrate 参数, 说明是转换旧版本数据库
+    # 必须指定扫描时的根目录, 所有路径的公共目录不一定是根目录 (根目录下没有文件时)
+    if args_migrate != "Null" and args_output != "Null" and args_dst_folder != "Null":
+        return {"mode": "migrate",
+                "args_migrate": args_migrate,
+                "args_output": args_output,
+                "args_dst_folder": args_dst_folder}
+    # 指定了 -dupes 参数, 说明是查找重复文件, 此时 -db 只用于复用已经计算过的 hash 值
+    elif args_dst_folder != "Null" and args_dupes in ["true", "True"]:
+        return {"mode": "dupes",
+                "args_dst_folder": args_dst_folder,
+                "args_db": args_db,
+                "args_filter": args_filter,
+                "args_not_filter": args_not_filter,
+                "args_workers": args_workers,
+                "args_algo": args_algo,
+                "args_block_size": args_block_size,
+                "args_skip_symlinks": args_skip_symlinks,
+                "args_one_fs": args_one_fs,
+                "args_progress": args_progress,
+                "args_precount": args_precount,
+                "args_stats": args_stats,
+                "args_format": args_format,
+                "args_report": args_report,
+                "args_debug": args_debug}
+    # 同时指定了 -db 和 -db2 参数, 说明是两个数据库之间的比对, 不需要读取文件
+    elif args_dst_folder == "Null" and args_db != "Null" and args_db2 != "Null":
+        return {"mode": "dbcompare",
+                "args_db": args_db,
+                "args_db2": args_db2,
+                "args_format": args_format,
+                "args_report": args_report,
+                "args_debug": args_debug}
     # 指定了 -db 参数, 说明是比对模式
-    if args_dst_folder != "Null" and args_db != "Null":
+    elif args_dst_folder != "Null" and args_db != "Null":
         return {"mode": "compare",
                 "args_dst_folder": args_dst_folder,
                 "args_db": args_db,
                 "args_filter": args_filter,
                 "args_not_filter": args_not_filter,
+                "args_workers": args_workers,
+                "args_block_size": args_block_size,
+                "args_incremental": args_incremental,
+                "args_verify_sample": args_verify_sample,
+                "args_skip_symlinks": args_skip_symlinks,
+                "args_one_fs": args_one_fs,
+                "args_progress": args_progress,
+                "args_precount": args_precount,
+                "args_stats": args_stats,
+                "args_fast": args_fast,
+                "args_strict": args_strict,
+                "args_format": args_format,
+                "args_report": args_report,
                 "args_debug": args_debug}
     # 指定了 -o 参数, 说明是写入模式
     elif args_dst_folder != "Null" and args_output != "Null":
@@ -88,121 +292,1211 @@ def check_args(input_args):
                 "args_output": args_output,
                 "args_filter": args_filter,
                 "args_not_filter": args_not_filter,
+                "args_workers": args_workers,
+                "args_algo": args_algo,
+                "args_block_size": args_block_size,
+                "args_incremental": args_incremental,
+                "args_verify_sample": args_verify_sample,
+                "args_skip_symlinks": args_skip_symlinks,
+                "args_one_fs": args_one_fs,
+                "args_progress": args_progress,
+                "args_precount": args_precount,
+                "args_stats": args_stats,
                 "args_debug": args_debug}
     # 其余情况
     else:
         return {"mode": "help"}
 
 
-def file_hash(file_path):
+def sample_ranges(size, block_size=SAMPLE_BLOCK_SIZE):
+    """
+    抽样数据块的位置, 大文件为头部/中间/尾部各一块, 互不重叠; 小文件为整个文件
+    :param size: 文件大小
+    :param block_size: 数据块大小
+    :return: list, (offset, length)
+    """
+    if size <= block_size * 3:
+        return [(0, block_size * 3)]
+    return [(offset, block_size) for offset in (0, (size - block_size) // 2, size - block_size)]
+
+
+def file_hash(file_path, algo=DEFAULT_ALGO, block_size=BLOCK_SIZE, timer=None, sample_size=None):
+    """
+    分块读取文件并返回文件的 hash 值, 内存占用和文件大小无关
+    指定了 sample_size 时, 在同一次读取中保留抽样数据块, 同时返回和 file_sample_hash 一致的抽样 hash 值
+    :param file_path:
+    :param algo: hashlib 支持的算法, 默认是 sha1
+    :param block_size: 每次读取的数据块大小
+    :param timer: dict, 累加读取/计算的耗时和读取的字节数, keys: read / hash / bytes
+    :param sample_size: 遍历时获取的文件大小, 用于计算抽样数据块的位置
+    :return: str, 指定了 sample_size 时为 (hash 值, 抽样 hash 值)
+    """
+    clock = time.perf_counter
+    read_seconds = 0.0
+    hash_seconds = 0.0
+    h = hashlib.new(algo)
+    # 小文件的抽样数据块就是整个文件, 抽样 hash 值即为完整的 hash 值, 不需要单独保留
+    ranges = sample_ranges(sample_size) if sample_size is not None and sample_size > SAMPLE_BLOCK_SIZE * 3 else []
+    blocks = [bytearray() for _ in ranges]
+    position = 0
+    t0 = clock()
+    # 不使用 mmap: 计算期间文件被截断 (例如 copytruncate 方式轮转的日志) 时, 访问超出文件末尾的映射会触发 SIGBUS 导致进程退出
+    read_bytes = 0
+    buf = bytearray(block_size)
+    with open(file_path, 'rb') as f:
+        read_seconds += clock() - t0
+        with memoryview(buf) as view:
+            while True:
+                t0 = clock()
+                size = f.readinto(buf)
+                t1 = clock()
+                read_seconds += t1 - t0
+                if not size:
+                    break
+                h.update(view[:size])
+                for block, (offset, length) in zip(blocks, ranges):
+                    start = max(offset, position)
+                    end = min(offset + length, position + size)
+                    if start < end:
+                        block += view[start - position:end - position]
+                position += size
+                hash_seconds += clock() - t1
+                read_bytes += size
+    if timer is not None:
+        timer["read"] = timer.get("read", 0.0) + read_seconds
+        timer["hash"] = timer.get("hash", 0.0) + hash_seconds
+        timer["bytes"] = timer.get("bytes", 0) + read_bytes
+    if sample_size is None:
+        return h.hexdigest()
+    if not ranges:
+        return h.hexdigest(), h.hexdigest()
+    sample = hashlib.new(algo)
+    for block in blocks:
+        sample.update(block)
+    return h.hexdigest(), sample.hexdigest()
+
+
+def file_sample_hash(file_path, size, algo=DEFAULT_ALGO, block_size=SAMPLE_BLOCK_SIZE, timer=None):
     """
-    读取文件并返回文件的 SHA1 值
+    读取文件头部/中间/尾部的数据块并返回 hash 值, 小文件则读取整个文件
     :param file_path:
+    :param size: 文件大小
+    :param algo: hash 算法
+    :param block_size: 数据块大小
+    :param timer: dict, 参考 file_hash
     :return:
     """
-    h = hashlib.sha1()
+    clock = time.perf_counter
+    h = hashlib.new(algo)
+    t0 = clock()
     with open(file_path, 'rb') as f:
-        data = f.read()
-        h.update(data)
+        blocks = []
+        for offset, length in sample_ranges(size, block_size):
+            f.seek(offset)
+            blocks.append(f.read(length))
+    t1 = clock()
+    for block in blocks:
+        h.update(block)
+    if timer is not None:
+        timer["read"] = timer.get("read", 0.0) + t1 - t0
+        timer["hash"] = timer.get("hash", 0.0) + clock() - t1
+        timer["bytes"] = timer.get("bytes", 0) + sum(len(block) for block in blocks)
     return h.hexdigest()
 
 
+def load_pickle_db(dbname):
+    """
+    读取旧版本的 pickle 数据库, 兼容最早的 {filepath: sha1} 格式
+    :param dbname:
+    :return: dict, keys: version / algo / files, files 的值为 {"hash", "size", "mtime_ns", "inode"}
+    """
+    with open(dbname, 'rb') as f:
+        diffdb = pickle.load(f)
+    if not isinstance(diffdb.get("version"), int):
+        diffdb = {"version": 1, "algo": DEFAULT_ALGO, "files": diffdb}
+    # 旧版本只保存了 hash 值, 没有文件的元数据
+    if diffdb.get("version") < 3:
+        diffdb["files"] = {filepath: {"hash": filehash} for filepath, filehash in diffdb.get("files").items()}
+    return diffdb
+
+
+def db_key(root, filepath):
+    """
+    将文件的绝对路径转换为数据库中的相对路径, 统一使用 / 作为分隔符, 这样可以和挂载到其他位置的副本进行比对
+    :param root: 扫描的根目录
+    :param filepath:
+    :return: str
+    """
+    return os.path.relpath(filepath, root).replace(os.sep, "/")
+
+
+def key_blob(key):
+    """
+    数据库中的路径以 UTF-8 字节保存, Linux 下无法解码的文件名(surrogateescape)也可以写入并还原
+    :param key: db_key 返回的相对路径
+    :return: bytes
+    """
+    return key.encode("utf-8", "surrogateescape")
+
+
+def blob_key(value):
+    """
+    将数据库中保存的路径还原为 str, key_blob 的逆操作
+    :param value: bytes
+    :return: str
+    """
+    return value.decode("utf-8", "surrogateescape")
+
+
+def init_diff_db(conn, algo, root):
+    """
+    创建数据库的表结构
+    :param conn: sqlite3 连接
+    :param algo: hash 算法
+    :param root: 扫描的根目录
+    :return:
+    """
+    conn.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)")
+    conn.execute("CREATE TABLE files (path BLOB PRIMARY KEY, hash TEXT, size INTEGER, mtime_ns INTEGER, inode INTEGER, sample TEXT, parent BLOB) WITHOUT ROWID")
+    conn.execute("CREATE INDEX files_parent ON files (parent)")
+    # 文件夹的摘要, 根目录的 path 为空, parent 为 NULL
+    conn.execute("CREATE TABLE dirs (path BLOB PRIMARY KEY, parent BLOB, digest TEXT, file_count INTEGER) WITHOUT ROWID")
+    conn.execute("CREATE INDEX dirs_parent ON dirs (parent)")
+    conn.executemany("INSERT INTO meta VALUES (?, ?)", [("algo", algo), ("root", key_blob(root))])
+    conn.execute("PRAGMA user_version = {}".format(DB_VERSION))
+
+
+def parent_key(key):
+    """
+    获取数据库中相对路径的上级文件夹, 根目录下的文件为空字符串
+    :param key: db_key 返回的相对路径
+    :return: str
+    """
+    return key.rpartition("/")[0]
+
+
+def dir_digest(algo, children):
+    """
+    根据文件夹中的文件和子文件夹计算文件夹的摘要, 子文件夹使用自身的摘要, 类似 Merkle 树
+    内容相同的文件夹在任何主机上的摘要都相同
+    :param algo: hash 算法
+    :param children: list, (类型 F/D, 名称, hash 值或摘要)
+    :return: str
+    """
+    digest = hashlib.new(algo)
+    for kind, name, value in sorted(children):
+        digest.update("{}\0{}\0{}\n".format(kind, name, value).encode("utf-8", "surrogateescape"))
+    return digest.hexdigest()
+
+
+def build_dir_digests(conn, algo):
+    """
+    按照路径顺序遍历所有文件, 由下向上计算每个文件夹的摘要并写入 dirs 表
+    同一个文件夹中的文件在路径顺序中是连续的, 所以只需要保存当前路径上各级文件夹的子项, 内存占用和文件数量无关
+    :param conn: sqlite3 连接
+    :param algo: hash 算法
+    :return:
+    """
+    conn.execute("DELETE FROM dirs")
+    rows = []
+    # 当前路径上的各级文件夹: [文件夹, 子项列表, 文件数量]
+    stack = [["", [], 0]]
+
+    def close_dir():
+        path, children, file_count = stack.pop()
+        digest = dir_digest(algo, children)
+        rows.append((key_blob(path), key_blob(parent_key(path)) if path else None, digest, file_count))
+        if stack:
+            stack[-1][1].append(("D", path.rpartition("/")[2], digest))
+            stack[-1][2] += file_count
+        if len(rows) >= DB_BATCH_SIZE:
+            conn.executemany("INSERT INTO dirs VALUES (?, ?, ?, ?)", rows)
+            rows.clear()
+
+    for key, filehash in conn.execute("SELECT path, hash FROM files ORDER BY path"):
+        key = blob_key(key)
+        parent = parent_key(key)
+        # 离开不包含当前文件的文件夹时, 该文件夹的子项已经完整
+        while len(stack) > 1 and parent != stack[-1][0] and not parent.startswith(stack[-1][0] + "/"):
+            close_dir()
+        while stack[-1][0] != parent:
+            top = stack[-1][0]
+            name = (parent[len(top) + 1:] if top else parent).split("/")[0]
+            stack.append([top + "/" + name if top else name, [], 0])
+        stack[-1][1].append(("F", key.rpartition("/")[2], filehash))
+        stack[-1][2] += 1
+    while stack:
+        close_dir()
+    conn.executemany("INSERT INTO dirs VALUES (?, ?, ?, ?)", rows)
+
+
+def new_diff_db(dbname):
+    """
+    在临时文件中创建空的数据库, 写入完成后再通过 commit_diff_db 替换目标文件, 中途失败不会损坏原来的数据库
+    :param dbname:
+    :return: sqlite3 连接
+    """
+    tmpname = dbname + ".tmp"
+    if os.path.exists(tmpname):
+        os.remove(tmpname)
+    conn = sqlite3.connect(tmpname)
+    # 临时文件最终会被整体替换, 不需要回滚日志, 提交时仍然会落盘
+    conn.execute("PRAGMA journal_mode = OFF")
+    return conn
+
+
+def commit_diff_db(conn, dbname):
+    """
+    提交数据并替换目标文件
+    :param conn:
+    :param dbname:
+    :return:
+    """
+    conn.commit()
+    conn.close()
+    os.replace(dbname + ".tmp", dbname)
+
+
+def discard_diff_db(conn, dbname):
+    """
+    写入失败时关闭连接并删除临时文件, 目标文件保持不变
+    :param conn:
+    :param dbname:
+    :return:
+    """
+    conn.close()
+    if os.path.exists(dbname + ".tmp"):
+        os.remove(dbname + ".tmp")
+
+
+def insert_entries(conn, rows):
+    """
+    批量写入记录, 上级文件夹由 path 计算
+    :param conn:
+    :param rows: list, (path, hash, size, mtime_ns, inode, sample)
+    :return:
+    """
+    conn.executemany("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?)",
+                     [(key_blob(row[0]),) + row[1:] + (key_blob(parent_key(row[0])),) for row in rows])
+
+
+def migrate_pickle_db(conn, legacy, root=None):
+    """
+    将旧版本 pickle 数据库中的记录写入到 SQLite 数据库中
+    :param conn: sqlite3 连接
+    :param legacy: load_pickle_db 返回的数据
+    :param root: 根目录, 默认使用所有路径的公共目录
+    :return: str, 使用的根目录
+    """
+    files = legacy.get("files")
+    if root is None:
+        root = os.path.commonpath([os.path.dirname(filepath) for filepath in files]) if files else os.path.abspath("./")
+    init_diff_db(conn, legacy.get("algo"), root)
+    rows = []
+    for filepath, entry in files.items():
+        rows.append((db_key(root, filepath), entry.get("hash"), entry.get("size"), entry.get("mtime_ns"), entry.get("inode"), None))
+        if len(rows) >= DB_BATCH_SIZE:
+            insert_entries(conn, rows)
+            rows = []
+    insert_entries(conn, rows)
+    build_dir_digests(conn, legacy.get("algo"))
+    conn.commit()
+    return root
+
+
+def open_diff_db(dbname, root=None):
+    """
+    以只读方式打开 hash 数据库, 不会修改数据库文件, 旧版本的 pickle 数据库会被转换到内存中
+    :param dbname:
+    :param root: 扫描的根目录, 旧版本的 pickle 数据库中保存的是绝对路径, 需要转换为相对于该目录的路径
+    :return: sqlite3 连接
+    """
+    with open(dbname, "rb") as f:
+        header = f.read(len(SQLITE_HEADER))
+    if header != SQLITE_HEADER:
+        print("[INFO] {} is a legacy pickle database, it can be converted by -migrate.".format(dbname))
+        conn = sqlite3.connect(":memory:")
+        migrate_pickle_db(conn, load_pickle_db(dbname), root)
+        return conn
+    conn = sqlite3.connect("file:{}?mode=ro".format(pathname2url(os.path.abspath(dbname))), uri=True)
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    if version != DB_VERSION:
+        conn.close()
+        raise ValueError("database version {} is not supported, please create the database again".format(version))
+    return conn
+
+
+def db_meta(conn):
+    """
+    读取数据库的元信息
+    :param conn:
+    :return: dict, keys: algo / root
+    """
+    return {key: blob_key(value) if isinstance(value, bytes) else value for key, value in conn.execute("SELECT key, value FROM meta")}
+
+
+def db_lookup(conn, key):
+    """
+    查询单个文件的记录
+    :param conn:
+    :param key: db_key 返回的相对路径
+    :return: dict or None
+    """
+    row = conn.execute("SELECT hash, size, mtime_ns, inode, sample FROM files WHERE path = ?", (key_blob(key),)).fetchone()
+    if row is None:
+        return None
+    return {"hash": row[0], "size": row[1], "mtime_ns": row[2], "inode": row[3], "sample": row[4]}
+
+
+def same_stat(entry, prior):
+    """
+    判断文件的元数据是否和记录中的一致
+    :param entry: 当前文件的记录
+    :param prior: 数据库中的记录
+    :return: bool
+    """
+    return prior is not None and \
+        prior.get("size") == entry.get("size") and \
+        prior.get("mtime_ns") == entry.get("mtime_ns") and \
+        prior.get("inode") == entry.get("inode")
+
+
+def file_entry(file_path, st=None, prior=None, options=None):
+    """
+    获取文件的元数据和 hash 值, 如果元数据和之前的记录一致, 则直接复用之前的 hash 值
+    快速比对时依次比较文件大小/抽样数据块的 hash 值, 只有 strict 模式才会读取整个文件
+    :param file_path:
+    :param st: 遍历时已经获取的元数据, 为 None 时重新获取
+    :param prior: 之前的记录, 为 None 时总是计算 hash
+    :param options: dict, keys:
+                    algo: hash 算法
+                    block_size: 每次读取的数据块大小
+                    verify_sample: 元数据一致时, 仍然按照该比例重新计算 hash
+                    sample: 是否计算抽样数据块的 hash 值
+                    full: 是否计算完整的 hash 值, 默认为 True
+                    fast: 是否使用快速比对
+                    strict: 快速比对时, 抽样一致的文件是否再比对完整的 hash 值
+    :return: dict, keys: hash / size / mtime_ns / inode / sample / reused / prior / timing
+    """
+    if options is None:
+        options = {}
+    algo = options.get("algo", DEFAULT_ALGO)
+    block_size = options.get("block_size", BLOCK_SIZE)
+    timer = {"stat": 0.0, "read": 0.0, "hash": 0.0, "bytes": 0}
+    # 先获取元数据再计算 hash, 计算期间文件被修改的话, 下次扫描时元数据会不一致
+    if st is None:
+        t0 = time.perf_counter()
+        st = os.stat(file_path)
+        timer["stat"] = time.perf_counter() - t0
+    entry = {"hash": None, "size": st.st_size, "mtime_ns": st.st_mtime_ns, "inode": st.st_ino, "sample": None,
+             "reused": False, "prior": prior, "timing": timer}
+    if same_stat(entry, prior) and random.random() >= options.get("verify_sample", 0.0):
+        entry["hash"] = prior.get("hash")
+        entry["sample"] = prior.get("sample")
+        entry["reused"] = True
+        if options.get("sample") and entry.get("sample") is None:
+            # 小文件的抽样 hash 值即为完整的 hash 值, 不需要读取文件
+            if st.st_size <= SAMPLE_BLOCK_SIZE * 3 and entry.get("hash") is not None:
+                entry["sample"] = entry.get("hash")
+            else:
+                entry["sample"] = file_sample_hash(file_path, st.st_size, algo, timer=timer)
+    elif options.get("fast"):
+        # 新增的文件没有可以比对的记录, 不读取文件
+        if prior is None:
+            return entry
+        # 文件大小不一致, 说明文件已经被修改
+        if prior.get("size") is not None and prior.get("size") != st.st_size:
+            return entry
+        # 抽样数据块不一致, 说明文件已经被修改
+        if prior.get("sample") is not None:
+            entry["sample"] = file_sample_hash(file_path, st.st_size, algo, timer=timer)
+            if entry.get("sample") != prior.get("sample"):
+                return entry
+            if not options.get("strict"):
+                entry["hash"] = prior.get("hash")
+                return entry
+        entry["hash"] = file_hash(file_path, algo, block_size, timer)
+    elif options.get("full", True) and options.get("sample"):
+        # 只读取一次文件, 同时得到完整的 hash 值和抽样 hash 值
+        entry["hash"], entry["sample"] = file_hash(file_path, algo, block_size, timer, st.st_size)
+    elif options.get("full", True):
+        entry["hash"] = file_hash(file_path, algo, block_size, timer)
+    elif options.get("sample"):
+        entry["sample"] = file_sample_hash(file_path, st.st_size, algo, timer=timer)
+    return entry
+
+
+def compile_filters(filter, not_filter):
+    """
+    预编译过滤条件, 只需要编译一次
+    :param filter:
+    :param not_filter:
+    :return: tuple, (filter, not_filter), not_filter 可能为 None
+    """
+    return re.compile(filter, re.IGNORECASE), re.compile(not_filter, re.IGNORECASE) if not_filter != None else None
+
+
+def path_matched(filepath, filters):
+    """
+    判断文件路径是否符合过滤条件
+    :param filepath: 文件的绝对路径
+    :param filters: compile_filters 返回的过滤条件
+    :return: bool
+    """
+    filter, not_filter = filters
+    if not_filter is not None and not_filter.search(filepath):
+        return False
+    return filter.search(filepath) is not None
+
+
+def walk_files(dst_folder, filters, skip_symlinks=False, one_fs=False, stats=None, unreadable=None):
+    """
+    使用 os.scandir 遍历指定文件夹, 按照固定的顺序返回符合过滤条件的文件路径
+    文件夹路径 (以分隔符结尾) 符合 not_filter 时, 整个文件夹都不会再遍历
+    :param dst_folder:
+    :param filters: compile_filters 返回的过滤条件
+    :param skip_symlinks: 是否跳过符号链接
+    :param one_fs: 是否跳过其他文件系统的文件夹
+    :param stats: new_scan_stats 返回的统计信息, 累加获取元数据的耗时
+    :param unreadable: list, 无法读取的文件夹的绝对路径会追加到这个列表中
+    :return: generator, (文件的绝对路径, 文件的元数据)
+    """
+    clock = time.perf_counter
+    not_filter = filters[1]
+    root = os.path.abspath(dst_folder)
+    root_dev = os.stat(root).st_dev if one_fs else None
+    # 使用栈代替递归, 顺序和 os.walk 一致: 先返回当前文件夹的文件, 再依次进入子文件夹
+    stack = [root]
+    while stack:
+        folder = stack.pop()
+        try:
+            with os.scandir(folder) as it:
+                entries = sorted(it, key=lambda x: x.name)
+        except OSError as e:
+            print("[WARN] Can't read folder\n-> Folder is: {}\n-> Reason is: {}".format(folder, e), file=sys.stderr)
+            if unreadable is not None:
+                unreadable.append(folder)
+            continue
+        subfolders = []
+        for entry in entries:
+            if skip_symlinks and entry.is_symlink():
+                continue
+            try:
+                # 和 os.walk 一致, 不进入指向文件夹的符号链接
+                if entry.is_dir(follow_symlinks=False):
+                    if not_filter is not None and not_filter.search(entry.path + os.sep):
+                        continue
+                    if root_dev is not None and entry.stat(follow_symlinks=False).st_dev != root_dev:
+                        continue
+                    subfolders.append(entry.path)
+                elif entry.is_file() and path_matched(entry.path, filters):
+                    # DirEntry 会缓存元数据, 计算 hash 时不需要再次获取
+                    t0 = clock()
+                    st = entry.stat()
+                    if stats is not None:
+                        stats["phases"]["stat"] += clock() - t0
+                    yield entry.path, st
+            except OSError:
+                # 元数据获取失败时, 交给计算 hash 时再报告错误
+                yield entry.path, None
+        stack.extend(reversed(subfolders))
+
+
+def count_files(files):
+    """
+    预先统计需要处理的文件数量和大小, 用于计算剩余时间
+    :param files: walk_files 返回的 (文件路径, 元数据)
+    :return: tuple, (文件数量, 文件大小)
+    """
+    total_files = 0
+    total_bytes = 0
+    for filepath, st in files:
+        total_files += 1
+        total_bytes += st.st_size if st is not None else 0
+    return total_files, total_bytes
+
+
+def new_scan_stats(progress=0.0, total_files=None, total_bytes=None):
+    """
+    创建扫描的统计信息, 只在主线程中更新, 不需要加锁
+    :param progress: 输出进度的间隔秒数, 0 表示不输出
+    :param total_files: 预先统计的文件数量
+    :param total_bytes: 预先统计的文件大小
+    :return: dict
+    """
+    now = time.perf_counter()
+    return {"start": now, "last_progress": now, "progress": progress,
+            "files": 0, "bytes": 0, "read_bytes": 0, "reused": 0, "errors": 0,
+            "total_files": total_files, "total_bytes": total_bytes,
+            "phases": dict.fromkeys(SCAN_PHASES, 0.0), "slowest": []}
+
+
+def timed_walk(files, stats):
+    """
+    统计遍历文件夹的耗时, 其中包含了 walk_files 中单独统计的 stat 耗时
+    :param files: walk_files 返回的生成器
+    :param stats:
+    :return: generator
+    """
+    clock = time.perf_counter
+    it = iter(files)
+    while True:
+        t0 = clock()
+        try:
+            item = next(it)
+        except StopIteration:
+            stats["phases"]["walk"] += clock() - t0
+            return
+        stats["phases"]["walk"] += clock() - t0
+        yield item
+
+
+def timed_call(stats, phase, func):
+    """
+    统计函数调用的耗时
+    :param stats:
+    :param phase: SCAN_PHASES 中的阶段
+    :param func:
+    :return: function
+    """
+    def wrapper(*args):
+        t0 = time.perf_counter()
+        try:
+            return func(*args)
+        finally:
+            stats["phases"][phase] += time.perf_counter() - t0
+    return wrapper
+
+
+def record_entry(stats, filepath, entry):
+    """
+    记录单个文件的处理结果, 并按照间隔输出进度
+    :param stats:
+    :param filepath:
+    :param entry: file_entry 返回的记录, 为 None 表示处理失败
+    :return:
+    """
+    if entry is None:
+        stats["errors"] += 1
+    else:
+        timing = entry.get("timing")
+        stats["files"] += 1
+        stats["bytes"] += entry.get("size")
+        stats["read_bytes"] += timing.get("bytes")
+        if entry.get("reused"):
+            stats["reused"] += 1
+        for phase in ["stat", "read", "hash"]:
+            stats["phases"][phase] += timing.get(phase)
+        # 使用小顶堆保留最慢的文件
+        seconds = timing.get("read") + timing.get("hash")
+        if len(stats["slowest"]) < SLOWEST_FILES:
+            heapq.heappush(stats["slowest"], (seconds, filepath, entry.get("size")))
+        elif seconds > stats["slowest"][0][0]:
+            heapq.heapreplace(stats["slowest"], (seconds, filepath, entry.get("size")))
+    show_progress(stats)
+
+
+def show_progress(stats, force=False):
+    """
+    按照间隔输出进度到标准错误
+    :param stats:
+    :param force: 是否忽略间隔立即输出
+    :return:
+    """
+    if stats.get("progress") <= 0:
+        return
+    now = time.perf_counter()
+    if not force and now - stats.get("last_progress") < stats.get("progress"):
+        return
+    stats["last_progress"] = now
+    elapsed = max(now - stats.get("start"), 1e-9)
+    done_files = stats.get("files") + stats.get("errors")
+    total_files = stats.get("total_files")
+    total_bytes = stats.get("total_bytes")
+    # 优先按照字节数估算剩余时间, 大文件和小文件混合时更准确
+    eta = "-"
+    if total_bytes and stats.get("bytes") > 0:
+        eta = "{:.0f}s".format(elapsed * max(total_bytes - stats.get("bytes"), 0) / stats.get("bytes"))
+    elif total_files and done_files > 0:
+        eta = "{:.0f}s".format(elapsed * max(total_files - done_files, 0) / done_files)
+    print("[PROGRESS] files: {}/{} | size: {:.1f}/{} MB | {:.1f} files/s | {:.2f} MB/s | ETA: {}".format(
+        done_files, total_files if total_files is not None else "-",
+        stats.get("bytes") / 1024 / 1024, "{:.1f}".format(total_bytes / 1024 / 1024) if total_bytes is not None else "-",
+        done_files / elapsed, stats.get("read_bytes") / 1024 / 1024 / elapsed, eta), file=sys.stderr)
+
+
+def stats_summary(stats):
+    """
+    生成统计结果, 多线程时 read/hash 的耗时是所有线程的累加值
+    :param stats:
+    :return: dict
+    """
+    elapsed = time.perf_counter() - stats.get("start")
+    phases = dict(stats.get("phases"))
+    # walk 的耗时中包含了 stat 的耗时
+    phases["walk"] = max(phases.get("walk") - phases.get("stat"), 0.0)
+    return {
+        "elapsed_seconds": round(elapsed, 4),
+        "files": stats.get("files"),
+        "errors": stats.get("errors"),
+        "reused": stats.get("reused"),
+        "bytes": stats.get("bytes"),
+        "read_bytes": stats.get("read_bytes"),
+        "files_per_sec": round(stats.get("files") / elapsed, 2) if elapsed > 0 else None,
+        "read_mb_per_sec": round(stats.get("read_bytes") / 1024 / 1024 / elapsed, 2) if elapsed > 0 else None,
+        "phase_seconds": {phase: round(seconds, 4) for phase, seconds in phases.items()},
+        "slowest_files": [{"path": filepath, "seconds": round(seconds, 4), "size": size}
+                          for seconds, filepath, size in sorted(stats.get("slowest"), reverse=True)],
+    }
+
+
+def save_stats(stats, filename):
+    """
+    输出进度并将统计结果保存为 JSON
+    :param stats:
+    :param filename: "Null" 表示不保存
+    :return:
+    """
+    show_progress(stats, force=True)
+    if filename != "Null":
+        with open(filename, "w") as f:
+            json.dump(stats_summary(stats), f, indent=2)
+
+
+def scan_stats(args_dict, files):
+    """
+    根据参数创建统计信息, 需要时预先统计文件数量
+    :param args_dict:
+    :param files: 预先统计时使用的 walk_files 生成器
+    :return: dict
+    """
+    total_files, total_bytes = None, None
+    if args_dict.get("args_precount") in ["true", "True"]:
+        total_files, total_bytes = count_files(files)
+    return new_scan_stats(args_dict.get("args_progress"), total_files, total_bytes)
+
+
+def open_report(report):
+    """
+    打开比对结果的输出文件, 默认为标准输出, 使用较大的缓冲区批量写入, 无法解码的文件名按原始字节输出
+    :param report: 文件名, "Null" 表示标准输出
+    :return: 文件对象
+    """
+    if report == "Null":
+        sys.stdout.flush()
+        return open(sys.stdout.fileno(), "w", buffering=REPORT_BUFFER_SIZE, encoding="utf-8", errors="surrogateescape", newline="", closefd=False)
+    return open(report, "w", buffering=REPORT_BUFFER_SIZE, encoding="utf-8", errors="surrogateescape", newline="")
+
+
+def report_writer(out, fmt):
+    """
+    根据输出格式返回写入比对结果的函数
+    :param out: open_report 返回的文件对象
+    :param fmt: text / jsonl / csv
+    :return: function, 参数为 (status, filepath, filehash, dbhash)
+    """
+    tags = {"added": "[ADDED]", "deleted": "[DELETED]", "modified": "[DIFF]", "unchanged": "[SAME]", "unreadable": "[UNREADABLE]"}
+    if fmt == "jsonl":
+        def write(status, filepath, filehash, dbhash):
+            out.write(json.dumps({"status": status, "path": filepath, "hash": filehash, "db_hash": dbhash}) + "\n")
+    elif fmt == "csv":
+        csv_writer = csv.writer(out)
+        csv_writer.writerow(["status", "path", "hash", "db_hash"])
+
+        def write(status, filepath, filehash, dbhash):
+            csv_writer.writerow([status, filepath, filehash, dbhash])
+    else:
+        def write(status, filepath, filehash, dbhash):
+            out.write("{}: {} | {} | {}\n".format(tags.get(status), filehash, dbhash, filepath))
+    return write
+
+
+def dupes_writer(out, fmt):
+    """
+    根据输出格式返回写入重复文件的函数
+    :param out: open_report 返回的文件对象
+    :param fmt: text / jsonl / csv
+    :return: function, 参数为 (filehash, size, filepaths)
+    """
+    if fmt == "jsonl":
+        def write(filehash, size, filepaths):
+            out.write(json.dumps({"hash": filehash, "size": size, "count": len(filepaths),
+                                  "reclaimable": size * (len(filepaths) - 1), "paths": filepaths}) + "\n")
+    elif fmt == "csv":
+        csv_writer = csv.writer(out)
+        csv_writer.writerow(["hash", "size", "path"])
+
+        def write(filehash, size, filepaths):
+            for filepath in filepaths:
+                csv_writer.writerow([filehash, size, filepath])
+    else:
+        def write(filehash, size, filepaths):
+            for filepath in filepaths:
+                out.write("[DUPE]: {} | {} | {}\n".format(filehash, size, filepath))
+    return write
+
+
+def _hash_result(filepath, future):
+    """
+    获取线程池中的计算结果
+    :param filepath:
+    :param future:
+    :return: tuple, (filepath, entry, error)
+    """
+    try:
+        return filepath, future.result(), None
+    except Exception as e:
+        return filepath, None, e
+
+
+def hash_files(files, workers=1, options=None, prior_lookup=None):
+    """
+    计算文件的 hash 值, workers 大于 1 时使用有界的线程池并发计算
+    遍历/计算/写入是同时进行的, 结果按照输入的顺序返回
+    :param files: 可迭代的 (文件路径, 元数据), 元数据可以为 None
+    :param workers: 并发数
+    :param options: 计算 hash 的选项, 参考 file_entry
+    :param prior_lookup: 根据文件路径查询之前记录的函数, 元数据一致的文件不再重新计算 hash
+    :return: generator, (filepath, entry, error)
+    """
+    if prior_lookup is None:
+        prior_lookup = lambda filepath: None
+
+    if workers <= 1:
+        for filepath, st in files:
+            try:
+                yield filepath, file_entry(filepath, st, prior_lookup(filepath), options), None
+            except Exception as e:
+                yield filepath, None, e
+        return
+
+    # 队列长度有上限, 避免遍历速度远大于计算速度时占用过多的内存
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for filepath, st in files:
+            pending.append((filepath, executor.submit(file_entry, filepath, st, prior_lookup(filepath), options)))
+            if len(pending) >= workers * 4:
+                yield _hash_result(*pending.popleft())
+        while pending:
+            yield _hash_result(*pending.popleft())
+
+
 def create_diff_db(args_dict):
     """
-    读取指定文件夹, 并将文件所对于的 SHA1 保存为字典, 并进行序列化保存
+    读取指定文件夹, 并将文件所对于的 hash 值和元数据边遍历边写入到数据库中
     :param args_dict:
     :return:
     """
     dst_folder = args_dict.get("args_dst_folder")
-    filter = args_dict.get("args_filter")
-    not_filter = args_dict.get("args_not_filter")
+    filters = compile_filters(args_dict.get("args_filter"), args_dict.get("args_not_filter"))
+    skip_symlinks = args_dict.get("args_skip_symlinks") in ["true", "True"]
+    one_fs = args_dict.get("args_one_fs") in ["true", "True"]
     dbname = args_dict.get("args_output")
+    workers = args_dict.get("args_workers")
+    algo = args_dict.get("args_algo")
+    block_size = args_dict.get("args_block_size")
+    incremental = args_dict.get("args_incremental") in ["true", "True"]
+    verify_sample = args_dict.get("args_verify_sample")
     debug = args_dict.get("args_debug")
     debug_value = debug in ["true", "True"]
-    diffdb = {}
-
-    if not_filter != None:
-        for root, dirs, files in os.walk(dst_folder):
-            for file in files:
-                filepath = os.path.abspath(os.path.join(root, file))
-                if re.findall(not_filter, filepath, re.IGNORECASE) == [] and re.findall(filter, filepath, re.IGNORECASE):
-                    try:
-                        filehash = file_hash(filepath)
-                        diffdb[filepath] = filehash
-                        if debug_value:
-                            print("[DEBUG] {} | {}".format(filehash, filepath))
-                    except Exception as e:
-                        print("[WARN] Can't calculate file hash\n-> File is: {}\n-> Reason is: {}".format(filehash, e))
-    else:
-        for root, dirs, files in os.walk(dst_folder):
-            for file in files:
-                filepath = os.path.abspath(os.path.join(root, file))
-                if re.findall(filter, filepath, re.IGNORECASE):
-                    try:
-                        filehash = file_hash(filepath)
-                        diffdb[filepath] = filehash
-                        if debug_value:
-                            print("[DEBUG] {} | {}".format(filehash, filepath))
-                    except Exception as e:
-                        print("[WARN] Can't calculate file hash\n-> File is: {}\n-> Reason is: {}".format(filehash, e))
-
-    with open(dbname, "wb") as f:
-        try:
-            pickle.dump(diffdb, f)
-            print("[INFO] diff db write finish, save path is: {}".format(os.path.abspath(dbname)))
-        except Exception as e:
-            print("[ERROR] Can't write hash database, reason is: {}".format(e))
+    root = os.path.abspath(dst_folder)
+    prior_conn = None
+    prior_lookup = None
+    file_count = 0
+    reused_count = 0
+    silent_count = 0
+
+    # 增量模式下, 复用已存在的数据库中元数据一致的记录
+    if incremental and os.path.exists(dbname):
+        prior_conn = open_diff_db(dbname, root)
+        prior_algo = db_meta(prior_conn).get("algo")
+        if prior_algo == algo:
+            prior_lookup = lambda filepath: db_lookup(prior_conn, db_key(root, filepath))
+        else:
+            print("[WARN] Hash algorithm of {} is {}, incremental mode will be ignored.".format(dbname, prior_algo))
+
+    stats = scan_stats(args_dict, walk_files(dst_folder, filters, skip_symlinks, one_fs))
+    if prior_lookup is not None:
+        prior_lookup = timed_call(stats, "db", prior_lookup)
+    conn = new_diff_db(dbname)
+    try:
+        init_diff_db(conn, algo, root)
+        insert = timed_call(stats, "db", insert_entries)
+        rows = []
+        options = {"algo": algo, "block_size": block_size, "verify_sample": verify_sample, "sample": True}
+        files = timed_walk(walk_files(dst_folder, filters, skip_symlinks, one_fs, stats), stats)
+        for filepath, entry, error in hash_files(files, workers, options, prior_lookup):
+            record_entry(stats, filepath, entry)
+            if error is not None:
+                print("[WARN] Can't calculate file hash\n-> File is: {}\n-> Reason is: {}".format(filepath, error))
+                continue
+            file_count += 1
+            if entry.get("reused"):
+                reused_count += 1
+            # 按照 -verify-sample 重新计算的文件, 元数据一致但是 hash 值不同, 说明内容被静默修改
+            prior = entry.get("prior")
+            if not entry.get("reused") and same_stat(entry, prior) and prior.get("hash") is not None and prior.get("hash") != entry.get("hash"):
+                silent_count += 1
+                print("[WARN] File content changed but size/mtime/inode are not changed\n-> File is: {}\n-> Hash is: {} -> {}".format(filepath, prior.get("hash"), entry.get("hash")))
+            rows.append((db_key(root, filepath), entry.get("hash"), entry.get("size"), entry.get("mtime_ns"), entry.get("inode"), entry.get("sample")))
+            if len(rows) >= DB_BATCH_SIZE:
+                insert(conn, rows)
+                rows = []
+            if debug_value:
+                print("[DEBUG] {} | {}".format(entry.get("hash"), filepath))
+        insert(conn, rows)
+        timed_call(stats, "db", build_dir_digests)(conn, algo)
+    except BaseException:
+        # 中途失败或者被中断时不保留临时文件
+        discard_diff_db(conn, dbname)
+        raise
+
+    if prior_conn is not None:
+        prior_conn.close()
+    if incremental:
+        print("[INFO] {} of {} file hashes were reused, {} verified files were changed silently.".format(reused_count, file_count, silent_count))
+
+    try:
+        timed_call(stats, "db", commit_diff_db)(conn, dbname)
+        print("[INFO] diff db write finish, save path is: {}".format(os.path.abspath(dbname)))
+    except Exception as e:
+        discard_diff_db(conn, dbname)
+        print("[ERROR] Can't write hash database, reason is: {}".format(e))
+    save_stats(stats, args_dict.get("args_stats"))
 
 
 def compare_diff_file(args_dict):
     """
-    读取指定文件夹, 并指出和记录中不相同的文件
+    读取指定文件夹, 将遍历到的文件和数据库中的记录合并比对, 得出新增/删除/修改/未修改的文件
+    增量模式下, 元数据和记录一致的文件视为未修改, 无法读取的文件夹中的记录单独报告, 不视为已删除
     :param args_dict:
     :return:
     """
     dst_folder = args_dict.get("args_dst_folder")
-    filter = args_dict.get("args_filter")
-    not_filter = args_dict.get("args_not_filter")
+    filters = compile_filters(args_dict.get("args_filter"), args_dict.get("args_not_filter"))
+    skip_symlinks = args_dict.get("args_skip_symlinks") in ["true", "True"]
+    one_fs = args_dict.get("args_one_fs") in ["true", "True"]
+    workers = args_dict.get("args_workers")
+    block_size = args_dict.get("args_block_size")
+    incremental = args_dict.get("args_incremental") in ["true", "True"]
+    verify_sample = args_dict.get("args_verify_sample")
+    fast = args_dict.get("args_fast") in ["true", "True"]
+    strict = args_dict.get("args_strict") in ["true", "True"]
+    fmt = args_dict.get("args_format")
+    report = args_dict.get("args_report")
     debug = args_dict.get("args_debug")
     debug_value = debug in ["true", "True"]
-    with open(args_dict.get("args_db"), 'rb') as f:
-        diffdb = pickle.load(f)
+    # 数据库中保存的是相对路径, 可以和挂载到其他位置的副本进行比对
+    root = os.path.abspath(dst_folder)
+    conn = open_diff_db(args_dict.get("args_db"), root)
+    # 使用数据库中记录的算法进行比对
+    algo = db_meta(conn).get("algo")
+    # 结构化的结果输出到标准输出时, 提示信息输出到标准错误, 避免混在一起
+    log = sys.stderr if fmt != "text" and report == "Null" else sys.stdout
+
+    counts = {"added": 0, "deleted": 0, "modified": 0, "unchanged": 0, "unreadable": 0}
+    seen = set()
+    unreadable = []
+    stats = scan_stats(args_dict, walk_files(dst_folder, filters, skip_symlinks, one_fs))
+    # 总是查询数据库中的记录, 非增量模式下则全部重新计算 hash
+    prior_lookup = timed_call(stats, "db", lambda filepath: db_lookup(conn, db_key(root, filepath)))
+    if not incremental:
+        verify_sample = 1.0
+
+    options = {"algo": algo, "block_size": block_size, "verify_sample": verify_sample, "fast": fast, "strict": strict}
+
+    out = open_report(report)
+    write = report_writer(out, fmt)
+    try:
+        files = timed_walk(walk_files(dst_folder, filters, skip_symlinks, one_fs, stats, unreadable), stats)
+        for filepath, entry, error in hash_files(files, workers, options, prior_lookup):
+            record_entry(stats, filepath, entry)
+            seen.add(db_key(root, filepath))
+            if error is not None:
+                print("[WARN] Can't calculate file hash\n-> File is: {}\n-> Reason is: {}".format(filepath, error), file=sys.stderr)
+                continue
+            filehash = entry.get("hash")
+            prior = entry.get("prior")
+            if prior is None:
+                status = "added"
+                dbhash = None
+            else:
+                dbhash = prior.get("hash")
+                status = "unchanged" if filehash == dbhash else "modified"
+            counts[status] += 1
+            if status != "unchanged" or debug_value:
+                write(status, filepath, filehash, dbhash)
+
+        # 数据库中存在, 但是没有遍历到的文件视为已删除, 位于无法读取的文件夹中的文件无法确认是否存在, 单独报告
+        t0 = time.perf_counter()
+        prefixes = tuple("" if key == "." else key + "/" for key in (db_key(root, folder) for folder in unreadable))
+        for key, dbhash in conn.execute("SELECT path, hash FROM files"):
+            key = blob_key(key)
+            if key in seen:
+                continue
+            filepath = os.path.join(root, key.replace("/", os.sep))
+            if path_matched(filepath, filters):
+                status = "unreadable" if prefixes and key.startswith(prefixes) else "deleted"
+                counts[status] += 1
+                write(status, filepath, None, dbhash)
+        stats["phases"]["db"] += time.perf_counter() - t0
+    finally:
+        out.close()
+        conn.close()
+    save_stats(stats, args_dict.get("args_stats"))
 
-    diff_count = 0
-
-    if not_filter != None:
-        for root, dirs, files in os.walk(dst_folder):
-            for file in files:
-                filepath = os.path.abspath(os.path.join(root, file))
-                if re.findall(not_filter, filepath, re.IGNORECASE) == [] and re.findall(filter, filepath, re.IGNORECASE):
-                    try:
-                        filehash = file_hash(filepath)
-                        if filehash != diffdb.get(filepath):
-                            print("[DIFF]: {} | {} | {}".format(filehash, diffdb.get(filepath), filepath))
-                            diff_count += 1
-                            if debug_value:
-                                print("[DEBUG] {} | {}".format(filehash, filepath))
-                    except Exception as e:
-                        print("[WARN] Can't calculate file hash\n-> File is: {}\n-> Reason is: {}".format(filehash, e))
+    if counts.get("added") + counts.get("deleted") + counts.get("modified") == 0:
+        print("[INFO] Comparison completed, no different files found.", file=log)
     else:
-        for root, dirs, files in os.walk(dst_folder):
-            for file in files:
-                filepath = os.path.abspath(os.path.join(root, file))
-                if re.findall(filter, filepath, re.IGNORECASE):
-                    try:
-                        filehash = file_hash(filepath)
-                        if filehash != diffdb.get(filepath):
-                            print("[DIFF]: {} | {} | {}".format(filehash, diffdb.get(filepath), filepath))
-                            diff_count += 1
-                        if debug_value:
-                            print("[DEBUG] {} | {}".format(filehash, filepath))
-                    except Exception as e:
-                        print("[WARN] Can't calculate file hash\n-> File is: {}\n-> Reason is: {}".format(filehash, e))
-
-    if diff_count == 0:
-        print("[INFO] Comparison completed, no different files found.")
+        print("[INFO] Total of {} different files were found! added: {}, deleted: {}, modified: {}, unchanged: {}".format(
+            counts.get("added") + counts.get("deleted") + counts.get("modified"),
+            counts.get("added"), counts.get("deleted"), counts.get("modified"), counts.get("unchanged")), file=log)
+    if counts.get("unreadable") > 0:
+        print("[WARN] {} files in {} folders that can't be read were not compared.".format(counts.get("unreadable"), len(unreadable)), file=log)
+
+
+def subtree_entries(conn, path):
+    """
+    查询数据库中某个文件夹下的所有文件, 利用主键的范围查询, 不需要逐级展开
+    :param conn: sqlite3 连接
+    :param path: 文件夹的相对路径
+    :return: generator, (path, hash)
+    """
+    # "0" 是 "/" 的下一个字符, 以 path + "/" 开头的路径都在这个范围内
+    rows = conn.execute("SELECT path, hash FROM files WHERE path >= ? AND path < ? ORDER BY path", (key_blob(path + "/"), key_blob(path + "0")))
+    return ((blob_key(key), filehash) for key, filehash in rows)
+
+
+def compare_diff_db(args_dict):
+    """
+    比对两个 hash 数据库, 不读取任何文件
+    从根目录开始比较文件夹的摘要, 只进入摘要不同的子目录, 摘要相同的子目录直接跳过
+    以 -db 为基准, -db2 中新增/删除/修改的文件
+    :param args_dict:
+    :return:
+    """
+    fmt = args_dict.get("args_format")
+    report = args_dict.get("args_report")
+    debug = args_dict.get("args_debug")
+    debug_value = debug in ["true", "True"]
+    log = sys.stderr if fmt != "text" and report == "Null" else sys.stdout
+    conn = open_diff_db(args_dict.get("args_db"))
+    conn2 = open_diff_db(args_dict.get("args_db2"))
+    algo = db_meta(conn).get("algo")
+    algo2 = db_meta(conn2).get("algo")
+    if algo != algo2:
+        conn.close()
+        conn2.close()
+        print("[ERROR] Hash algorithm is different, {} vs {}, please create the database with the same -algo.".format(algo, algo2), file=log)
+        return
+
+    counts = {"added": 0, "deleted": 0, "modified": 0, "unchanged": 0}
+    visited = 0
+    skipped = 0
+    out = open_report(report)
+    write = report_writer(out, fmt)
+    try:
+        root = conn.execute("SELECT digest FROM dirs WHERE path = ?", (b"",)).fetchone()
+        root2 = conn2.execute("SELECT digest FROM dirs WHERE path = ?", (b"",)).fetchone()
+        pending = [""] if root != root2 else []
+        if root == root2 and root is not None:
+            counts["unchanged"] = conn.execute("SELECT file_count FROM dirs WHERE path = ?", (b"",)).fetchone()[0]
+            skipped += 1
+        while pending:
+            path = pending.pop()
+            visited += 1
+            files = {blob_key(key): filehash for key, filehash in conn.execute("SELECT path, hash FROM files WHERE parent = ?", (key_blob(path),))}
+            files2 = {blob_key(key): filehash for key, filehash in conn2.execute("SELECT path, hash FROM files WHERE parent = ?", (key_blob(path),))}
+            for key in sorted(files.keys() | files2.keys()):
+                dbhash = files.get(key)
+                filehash = files2.get(key)
+                if dbhash is None:
+                    status = "added"
+                elif filehash is None:
+                    status = "deleted"
+                else:
+                    status = "unchanged" if filehash == dbhash else "modified"
+                counts[status] += 1
+                if status != "unchanged" or debug_value:
+                    write(status, key, filehash, dbhash)
+
+            dirs = {blob_key(key): (digest, file_count) for key, digest, file_count in
+                    conn.execute("SELECT path, digest, file_count FROM dirs WHERE parent = ?", (key_blob(path),))}
+            dirs2 = {blob_key(key): (digest, file_count) for key, digest, file_count in
+                     conn2.execute("SELECT path, digest, file_count FROM dirs WHERE parent = ?", (key_blob(path),))}
+            # 倒序入栈, 按照路径顺序输出
+            for key in sorted(dirs.keys() | dirs2.keys(), reverse=True):
+                if key not in dirs2:
+                    for filepath, dbhash in subtree_entries(conn, key):
+                        counts["deleted"] += 1
+                        write("deleted", filepath, None, dbhash)
+                elif key not in dirs:
+                    for filepath, filehash in subtree_entries(conn2, key):
+                        counts["added"] += 1
+                        write("added", filepath, filehash, None)
+                elif dirs.get(key)[0] == dirs2.get(key)[0]:
+                    skipped += 1
+                    counts["unchanged"] += dirs.get(key)[1]
+                    if debug_value:
+                        print("[DEBUG] Same subtree: {}".format(key), file=log)
+                else:
+                    pending.append(key)
+    finally:
+        out.close()
+        conn.close()
+        conn2.close()
+
+    print("[INFO] {} folders were compared, {} identical subtrees were skipped.".format(visited, skipped), file=log)
+    if counts.get("added") + counts.get("deleted") + counts.get("modified") == 0:
+        print("[INFO] Comparison completed, no different files found.", file=log)
+    else:
+        print("[INFO] Total of {} different files were found! added: {}, deleted: {}, modified: {}, unchanged: {}".format(
+            counts.get("added") + counts.get("deleted") + counts.get("modified"),
+            counts.get("added"), counts.get("deleted"), counts.get("modified"), counts.get("unchanged")), file=log)
+
+
+def find_dupes(args_dict):
+    """
+    查找内容重复的文件, 依次按照文件大小/抽样数据块的 hash 值/完整的 hash 值分组
+    只有前两步仍然相同的文件才会读取整个文件, 指定了 -db 时元数据一致的文件直接使用数据库中的 hash 值, 不读取文件
+    指向同一个文件的硬链接只保留第一个路径, 不视为重复文件
+    :param args_dict:
+    :return:
+    """
+    dst_folder = args_dict.get("args_dst_folder")
+    filters = compile_filters(args_dict.get("args_filter"), args_dict.get("args_not_filter"))
+    skip_symlinks = args_dict.get("args_skip_symlinks") in ["true", "True"]
+    one_fs = args_dict.get("args_one_fs") in ["true", "True"]
+    workers = args_dict.get("args_workers")
+    algo = args_dict.get("args_algo")
+    block_size = args_dict.get("args_block_size")
+    fmt = args_dict.get("args_format")
+    report = args_dict.get("args_report")
+    debug = args_dict.get("args_debug")
+    debug_value = debug in ["true", "True"]
+    root = os.path.abspath(dst_folder)
+    log = sys.stderr if fmt != "text" and report == "Null" else sys.stdout
+    stats = scan_stats(args_dict, walk_files(dst_folder, filters, skip_symlinks, one_fs))
+
+    conn = None
+    prior_lookup = None
+    if args_dict.get("args_db") != "Null":
+        conn = open_diff_db(args_dict.get("args_db"), root)
+        # 只有算法一致时才能复用数据库中的 hash 值
+        algo = db_meta(conn).get("algo")
+        prior_lookup = timed_call(stats, "db", lambda filepath: db_lookup(conn, db_key(root, filepath)))
+
+    # 第一步: 按照文件大小分组, 空文件不计算在内
+    by_size = {}
+    inodes = set()
+    link_count = 0
+    for filepath, st in timed_walk(walk_files(dst_folder, filters, skip_symlinks, one_fs, stats), stats):
+        if st is None or st.st_size == 0:
+            continue
+        # 硬链接指向同一个文件, 删除其中一个并不能释放空间, 只保留遍历到的第一个路径
+        # Windows 中 os.scandir 返回的 st_nlink 为 0, 不会合并
+        if st.st_nlink > 1:
+            if (st.st_dev, st.st_ino) in inodes:
+                link_count += 1
+                continue
+            inodes.add((st.st_dev, st.st_ino))
+        by_size.setdefault(st.st_size, []).append((filepath, st))
+    candidates = [item for items in by_size.values() if len(items) > 1 for item in items]
+    by_size = None
+    inodes = None
+
+    # 第二步: 数据库中元数据一致的文件直接使用记录中的 hash 值, 其余文件按照抽样数据块的 hash 值分组
+    known = []
+    if prior_lookup is not None:
+        unknown = []
+        for filepath, st in candidates:
+            prior = prior_lookup(filepath)
+            if same_stat({"size": st.st_size, "mtime_ns": st.st_mtime_ns, "inode": st.st_ino}, prior) and prior.get("hash") is not None:
+                known.append((filepath, st.st_size, prior.get("hash")))
+            else:
+                unknown.append((filepath, st))
+        candidates = unknown
+    known_sizes = {size for filepath, size, filehash in known}
+    by_sample = {}
+    sts = dict(candidates)
+    options = {"algo": algo, "block_size": block_size, "sample": True, "full": False}
+    for filepath, entry, error in hash_files(candidates, workers, options):
+        record_entry(stats, filepath, entry)
+        if error is not None:
+            print("[WARN] Can't calculate file hash\n-> File is: {}\n-> Reason is: {}".format(filepath, error), file=sys.stderr)
+            continue
+        by_sample.setdefault((entry.get("size"), entry.get("sample")), []).append((filepath, entry))
+        if debug_value:
+            print("[DEBUG] {} | {}".format(entry.get("sample"), filepath), file=log)
+    candidates = None
+
+    # 第三步: 抽样仍然相同, 或者和已知 hash 值的文件大小相同的文件计算完整的 hash 值
+    # 小文件的抽样数据块就是整个文件, 抽样的 hash 值即为完整的 hash 值, 不需要再次读取
+    groups = {}
+    for filepath, size, filehash in known:
+        groups.setdefault((size, filehash), []).append(filepath)
+    full_candidates = []
+    for (size, sample), items in by_sample.items():
+        if len(items) < 2 and size not in known_sizes:
+            continue
+        for filepath, entry in items:
+            if size <= SAMPLE_BLOCK_SIZE * 3:
+                groups.setdefault((size, sample), []).append(filepath)
+            else:
+                full_candidates.append((filepath, sts.get(filepath)))
+    by_sample = None
+    sts = None
+
+    options = {"algo": algo, "block_size": block_size}
+    for filepath, entry, error in hash_files(full_candidates, workers, options):
+        record_entry(stats, filepath, entry)
+        if error is not None:
+            print("[WARN] Can't calculate file hash\n-> File is: {}\n-> Reason is: {}".format(filepath, error), file=sys.stderr)
+            continue
+        groups.setdefault((entry.get("size"), entry.get("hash")), []).append(filepath)
+    if conn is not None:
+        conn.close()
+
+    # 按照可以释放的空间从大到小输出
+    dupes = sorted(((size, filehash, sorted(filepaths)) for (size, filehash), filepaths in groups.items() if len(filepaths) > 1),
+                   key=lambda x: (-x[0] * (len(x[2]) - 1), x[1]))
+    out = open_report(report)
+    write = dupes_writer(out, fmt)
+    try:
+        for size, filehash, filepaths in dupes:
+            write(filehash, size, filepaths)
+    finally:
+        out.close()
+    save_stats(stats, args_dict.get("args_stats"))
+
+    if link_count > 0:
+        print("[INFO] {} hard links to files already listed were skipped.".format(link_count), file=log)
+    if len(dupes) == 0:
+        print("[INFO] Search completed, no duplicate files found.", file=log)
     else:
-        print("[INFO] Total of {} different files were found!".format(str(diff_count)))
+        print("[INFO] Total of {} duplicate groups were found! duplicate files: {}, reclaimable bytes: {}".format(
+            len(dupes), sum(len(filepaths) - 1 for size, filehash, filepaths in dupes),
+            sum(size * (len(filepaths) - 1) for size, filehash, filepaths in dupes)), file=log)
+
+
+def migrate_diff_db(args_dict):
+    """
+    将旧版本的 pickle 数据库转换为 SQLite 数据库
+    :param args_dict:
+    :return:
+    """
+    dbname = args_dict.get("args_output")
+    root = os.path.abspath(args_dict.get("args_dst_folder"))
+    legacy = load_pickle_db(args_dict.get("args_migrate"))
+    conn = new_diff_db(dbname)
+    try:
+        root = migrate_pickle_db(conn, legacy, root)
+        commit_diff_db(conn, dbname)
+    except BaseException:
+        discard_diff_db(conn, dbname)
+        raise
+    print("[INFO] {} entries were migrated, root path is: {}".format(len(legacy.get("files")), root))
+    print("[INFO] diff db write finish, save path is: {}".format(os.path.abspath(dbname)))
 
 
 if __name__ == "__main__":
@@ -214,22 +1508,55 @@ if __name__ == "__main__":
                 "\n",
                 "Usage:\n",
                 "1. Generate a filepath hash database on the src path\n",
-                "   diff_filepath.py -d <file/folder path>  -o <database name> [-filter <Regular Exp>] [-not-filter <Regular Exp>] [-debug True]\n",
+                "   diff_filepath.py -d <file/folder path>  -o <database name> [-filter <Regular Exp>] [-not-filter <Regular Exp>] [-workers N] [-algo <hash name>] [-block-size <bytes>] [-incremental True] [-verify-sample <rate>] [-skip-symlinks True] [-one-fs True] [-progress <seconds>] [-precount True] [-stats <json file>] [-debug True]\n",
                 "\n",
                 "2. Matching dst path using a hash database\n",
-                "   diff_filepath.py -d <file/folder path> -db <database file> [-filter <Regular Exp>] [-not-filter <Regular Exp>] [-debug True]\n",
+                "   diff_filepath.py -d <file/folder path> -db <database file> [-filter <Regular Exp>] [-not-filter <Regular Exp>] [-workers N] [-block-size <bytes>] [-incremental True] [-verify-sample <rate>] [-skip-symlinks True] [-one-fs True] [-fast True] [-strict True] [-format text|jsonl|csv] [-report <file>] [-progress <seconds>] [-precount True] [-stats <json file>] [-debug True]\n",
+                "\n",
+                "3. Compare two hash databases, only folders with different digests are walked\n",
+                "   diff_filepath.py -db <database file> -db2 <database file> [-format text|jsonl|csv] [-report <file>] [-debug True]\n",
+                "\n",
+                "4. Find duplicate files, reuse hashes in the database if -db is given\n",
+                "   diff_filepath.py -d <file/folder path> -dupes True [-db <database file>] [-filter <Regular Exp>] [-not-filter <Regular Exp>] [-workers N] [-algo <hash name>] [-format text|jsonl|csv] [-report <file>]\n",
+                "\n",
+                "5. Convert a legacy pickle hash database\n",
+                "   diff_filepath.py -migrate <pickle database> -o <database name> -d <root path>\n",
                 "\n",
                 "args:\n",
                 "# -d            Folder that require hash calculation\n",
                 "# -o            Create a hash database\n",
                 "# -db           Use hash database to compare file differences\n",
+                "# -db2         Compare with the -db database, added/deleted/modified are relative to -db\n",
+                "# -dupes        If the value is True, find files with the same content, empty files are ignored\n",
+                "# -migrate      Legacy pickle hash database, paths are saved relative to -d, which must be the folder it was created from\n",
                 "# -filter       Regular Exp String, matched path will be calculated hash\n",
-                "# -not-filter   Regular Exp String, matched path will not be calculated hash\n",
+                "# -not-filter   Regular Exp String, matched path will not be calculated hash, matched folder will not be walked\n",
+                "# -workers      Number of threads used to calculate hash, default is 1\n",
+                "# -algo         Hash algorithm saved in the database, like sha1/md5/blake2b, default is sha1\n",
+                "# -block-size   Bytes read per chunk when calculate hash, default is 1048576\n",
+                "# -incremental  If the value is True, reuse the saved hash when size/mtime/inode are not changed\n",
+                "# -verify-sample Rate between 0 and 1, unchanged files will still be hashed by this rate in incremental mode, silent changes are reported\n",
+                "# -skip-symlinks If the value is True, symbolic links will be skipped\n",
+                "# -one-fs       If the value is True, folders on other file systems will be skipped\n",
+                "# -fast         If the value is True, compare file size and sampled blocks first, new files will not be read\n",
+                "# -strict       If the value is True, files passed the fast compare will still be compared by full hash\n",
+                "# -format       Output format of compare result, text/jsonl/csv, default is text\n",
+                "# -report       Write compare result to this file instead of stdout\n",
+                "# -progress     Print progress to stderr every N seconds, default is 0 (disabled)\n",
+                "# -precount     If the value is True, count files before scan, so that progress can show the ETA\n",
+                "# -stats        Save phase timing, rates and slowest files to this JSON file\n",
                 "# -debug        If the value is True, it shows which files were read\n",
             )
         elif checked.get("mode") == "compare":
             compare_diff_file(checked)
+        elif checked.get("mode") == "dbcompare":
+            compare_diff_db(checked)
         elif checked.get("mode") == "create":
             create_diff_db(checked)
+        elif checked.get("mode") == "dupes":
+            find_dupes(checked)
+        elif checked.get("mode") == "migrate":
+            migrate_diff_db(checked)
     except Exception as e:
-        print("[ERROR] Execution error, reason is: {e}")
+        print(f"[ERROR] Execution error, reason is: {e}", file=sys.stderr)
+        sys.exit(1)
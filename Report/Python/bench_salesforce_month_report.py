@@ -0,0 +1,471 @@
+#!/usr/bin/python3
+# -*- coding: UTF-8 -*-
+
+########################################################################################################################
+#   author: zhanghong.personal@outlook.com
+#  version: 1.2
+#    usage:
+#      bench_salesforce_month_report.py -d <work folder> [-o <result json>] [-cases N] [-seed N] [-months N] [-chunk N] [-golden <json>] [-update-golden]
+# describe: Generate reproducible synthetic Salesforce exports, time each stage of salesforce_month_report.py and check KPI against golden values
+#
+# release nodes:
+#   2026.10.18 - first release
+#   2026.10.18 - failed runs fail the benchmark, KPI written by the script are checked too
+#   2026.10.18 - ship golden KPI for the default parameters, a missing golden file fails the benchmark
+########################################################################################################################
+
+import os
+import sys
+import csv
+import json
+import time
+import random
+import datetime
+import platform
+import subprocess
+
+# resource 只在 Unix 中存在, Windows 中不记录内存峰值
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# 被测试的脚本, 和当前脚本放在同一个文件夹中
+REPORT_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "salesforce_month_report.py")
+# 随脚本提交的 golden KPI, 对应默认参数生成的报告
+GOLDEN_FILE = os.path.join(os.path.dirname(REPORT_SCRIPT), "bench_salesforce_month_report_golden.json")
+sys.path.insert(0, os.path.dirname(REPORT_SCRIPT))
+import pandas as pd
+import salesforce_month_report
+
+# 生成报告时的基准时间, 固定的时间保证相同的参数总是生成相同的报告和 KPI, 基准时间所在的月份为当月
+REFERENCE_TIME = datetime.datetime(2026, 10, 18, 10, 0)
+# 最早的 case 创建时间
+START_TIME = datetime.datetime(2024, 1, 1)
+# 报告中时间的格式, 例如 2026-10-18 AM10:00
+CASE_DATE_FORMAT = salesforce_month_report.date_by_cases.get("Date/Time Opened")
+SURVEY_DATE_FORMAT = salesforce_month_report.date_by_survy.get("Customer Feed Back Survey: Last Modified Date")
+# 真实报告中还有很多不需要的列, 读取时会被忽略
+CASE_COLUMNS = salesforce_month_report.head_by_cases + ["Subject", "Account Name", "Product", "Priority", "Description"]
+SURVEY_COLUMNS = salesforce_month_report.head_by_survy + ["Survey Name", "Comments"]
+OWNERS = ["Owner {:02d}".format(i) for i in range(40)]
+PRODUCTS = ["Content Server", "Documentum", "Exstream", "Extended ECM", "Fortify", "LoadRunner"]
+# 已关闭的 case 有 survey 的比例, 以及 survey 被修改过 (有两条记录) 的比例
+SURVEY_RATIO = 0.4
+SURVEY_REPEAT = 0.2
+
+
+def check_args(input_args):
+    """
+    检查输入的参数
+    :param input_args:
+    :return: dict
+    """
+    args_dict = {"mode": "bench",
+                 "args_dst_folder": "Null",
+                 "args_output": "Null",
+                 "args_cases": 20000,
+                 "args_seed": 0,
+                 "args_months": 3,
+                 "args_chunk": salesforce_month_report.DEFAULT_STREAM_ROWS,
+                 "args_golden": "Null",
+                 "args_update_golden": False}
+
+    if len(input_args) <= 1:
+        return {"mode": "help"}
+    for args in input_args:
+        if args in ["-h", "help"]:
+            return {"mode": "help"}
+        try:
+            if args == "-d":
+                args_dict["args_dst_folder"] = input_args[input_args.index("-d") + 1]
+            elif args == "-o":
+                args_dict["args_output"] = input_args[input_args.index("-o") + 1]
+            elif args == "-cases":
+                args_dict["args_cases"] = int(input_args[input_args.index("-cases") + 1])
+            elif args == "-seed":
+                args_dict["args_seed"] = int(input_args[input_args.index("-seed") + 1])
+            elif args == "-months":
+                args_dict["args_months"] = int(input_args[input_args.index("-months") + 1])
+            elif args == "-chunk":
+                args_dict["args_chunk"] = int(input_args[input_args.index("-chunk") + 1])
+            elif args == "-golden":
+                args_dict["args_golden"] = input_args[input_args.index("-golden") + 1]
+            elif args == "-update-golden":
+                args_dict["args_update_golden"] = True
+        except:
+            return {"mode": "help"}
+
+    if args_dict.get("args_dst_folder") == "Null" or args_dict.get("args_cases") <= 0 or args_dict.get("args_months") <= 0:
+        return {"mode": "help"}
+    return args_dict
+
+
+def generate_reports(folder, cases, seed):
+    """
+    生成 cases 报告和 survey 报告, 逐行写入, 生成上百万行的报告时内存占用也很小
+    相同的参数总是生成相同的内容
+    :param folder: 生成的文件夹
+    :param cases: case 的数量
+    :param seed: 随机数种子
+    :return:
+    """
+    rnd = random.Random("salesforce-{}".format(seed))
+    os.makedirs(folder)
+    total_minutes = int((REFERENCE_TIME - START_TIME).total_seconds() // 60)
+
+    with open(os.path.join(folder, "report1.csv"), "w", newline="", encoding="utf-8") as case_file, \
+            open(os.path.join(folder, "report2.csv"), "w", newline="", encoding="utf-8") as survey_file:
+        case_writer = csv.writer(case_file, quoting=csv.QUOTE_ALL)
+        case_writer.writerow(CASE_COLUMNS)
+        survey_writer = csv.writer(survey_file, quoting=csv.QUOTE_ALL)
+        survey_writer.writerow(SURVEY_COLUMNS)
+        for i in range(cases):
+            case_number = "{:08d}".format(1000000 + i)
+            owner = rnd.choice(OWNERS)
+            opened = START_TIME + datetime.timedelta(minutes=rnd.randint(0, total_minutes))
+            closed = opened + datetime.timedelta(minutes=rnd.randint(30, 60 * 24 * 180))
+            is_closed = closed <= REFERENCE_TIME and rnd.random() < 0.9
+            ss = opened + datetime.timedelta(minutes=rnd.randint(10, 60 * 24 * 60)) if rnd.random() < 0.6 else None
+            if ss is not None and ss > (closed if is_closed else REFERENCE_TIME):
+                ss = None
+            age = round(((closed if is_closed else REFERENCE_TIME) - opened).total_seconds() / 86400, 1)
+            row = {
+                "Case Owner": owner,
+                "Case Number": case_number,
+                "Date/Time Opened": opened.strftime(CASE_DATE_FORMAT),
+                "Date/Time Closed": closed.strftime(CASE_DATE_FORMAT) if is_closed else "",
+                "Age (Days)": age,
+                "Suggested_Solution_Date": ss.strftime(CASE_DATE_FORMAT) if ss is not None else "",
+                "Status": "Closed" if is_closed else rnd.choice(["New", "In Progress", "Pending Customer", "Pending R&D"]),
+                "Knowledge Base Article": "KB{}".format(rnd.randint(100000, 999999)) if rnd.random() < 0.3 else "",
+                "Idol Knowledge Link": "https://kb.example.com/{}".format(i) if rnd.random() < 0.1 else "",
+                "R&D Incident": "OCTCR{}".format(rnd.randint(10000, 99999)) if rnd.random() < 0.2 else "",
+                "Escalated": 1 if rnd.random() < 0.05 else 0,
+                "Subject": "Issue {} with \"{}\", please check".format(i, rnd.choice(PRODUCTS)),
+                "Account Name": "Account {:05d}".format(rnd.randint(0, 20000)),
+                "Product": rnd.choice(PRODUCTS),
+                "Priority": rnd.choice(["P1", "P2", "P3", "P4"]),
+                "Description": "Line one\nLine two of case {}".format(i),
+            }
+            case_writer.writerow([row.get(x) for x in CASE_COLUMNS])
+
+            # 已关闭的 case 才会有 survey, 部分 case 的 survey 会被修改多次, 报告中会有多条记录
+            surveys = 0
+            if is_closed and rnd.random() < SURVEY_RATIO:
+                surveys = 2 if rnd.random() < SURVEY_REPEAT else 1
+            for _ in range(surveys):
+                modified = min(closed + datetime.timedelta(days=rnd.randint(0, 20)), REFERENCE_TIME)
+                row = {
+                    "Case Owner": owner,
+                    "Case Number": case_number,
+                    "Customer Feed Back Survey: Last Modified Date": modified.strftime(SURVEY_DATE_FORMAT),
+                    "OpenText made it easy to handle my case": rnd.choice(["", 3, 5, 7, 8, 9, 10]),
+                    "Satisfied with support experience": rnd.choice(["", 4, 6, 8, 9, 10]),
+                    "Survey Name": "Closed Case Survey",
+                    "Comments": rnd.choice(["", "Good", "Slow response, but solved"]),
+                }
+                survey_writer.writerow([row.get(x) for x in SURVEY_COLUMNS])
+
+
+def prepare_reports(work_folder, cases, seed):
+    """
+    准备测试用的报告, 参数一致时复用已经生成的报告
+    :param work_folder:
+    :param cases:
+    :param seed:
+    :return: str, 报告所在的文件夹
+    """
+    folder = os.path.join(work_folder, "cases_{}_seed_{}".format(cases, seed))
+    marker = folder + ".json"
+    params = {"cases": cases, "seed": seed, "reference": str(REFERENCE_TIME), "case_columns": CASE_COLUMNS, "survey_columns": SURVEY_COLUMNS}
+    if os.path.exists(marker) and os.path.isdir(folder):
+        with open(marker, "r") as f:
+            if json.load(f) == params:
+                return folder
+    if os.path.isdir(folder):
+        for root, dirs, files in os.walk(folder, topdown=False):
+            for file in files:
+                os.remove(os.path.join(root, file))
+            for d in dirs:
+                os.rmdir(os.path.join(root, d))
+        os.rmdir(folder)
+    print("[INFO] Generating {} cases in {}".format(cases, folder))
+    generate_reports(folder, cases, seed)
+    with open(marker, "w") as f:
+        json.dump(params, f)
+    return folder
+
+
+def peak_rss_kb():
+    """
+    获取当前进程到目前为止的内存峰值, ru_maxrss 在 Linux 中的单位是 KB
+    :return: int or None
+    """
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def bench_stages(folder, year, month):
+    """
+    依次运行 salesforce_month_report.py 的各个阶段, 记录每个阶段的时间和内存峰值
+    :param folder: 报告所在的文件夹
+    :param year:
+    :param month:
+    :return: (各阶段的结果, cases 数据, survey 数据, cases 报告, survey 报告)
+    """
+    stages = {}
+
+    def timed(name, func):
+        start = time.perf_counter()
+        result = func()
+        stages[name] = {"seconds": round(time.perf_counter() - start, 4), "peak_rss_kb": peak_rss_kb()}
+        print("[INFO] {:<10} {:>10.4f} s {:>10} KB RSS".format(name, stages[name].get("seconds"), stages[name].get("peak_rss_kb")))
+        return result
+
+    report_cases, report_survy = timed("header", lambda: salesforce_month_report.detect_reports(folder))
+    rawcase, rawsurv = timed("parse", lambda: (
+        pd.read_csv(report_cases, usecols=salesforce_month_report.head_by_cases, dtype=salesforce_month_report.dtype_by_cases, encoding="utf-8", encoding_errors='ignore'),
+        pd.read_csv(report_survy, usecols=salesforce_month_report.head_by_survy, dtype=salesforce_month_report.dtype_by_survy, encoding="utf-8", encoding_errors='ignore')))
+    rawcase, rawsurv = timed("datetime", lambda: (
+        salesforce_month_report.parse_dates(rawcase, salesforce_month_report.date_by_cases),
+        salesforce_month_report.parse_dates(rawsurv, salesforce_month_report.date_by_survy)))
+    backlog, backlog_history = timed("backlog", lambda: salesforce_month_report.backlog_cases(rawcase, year, month))
+    open_cases_m = rawcase[(rawcase["Date/Time Opened"].dt.year == year) & (rawcase["Date/Time Opened"].dt.month == month)]
+    timed("dtr", lambda: salesforce_month_report.dtr_report(rawcase, backlog, open_cases_m))
+    case_data = timed("cases", lambda: salesforce_month_report.case_report(rawcase, year, month, True))
+    rawsurv = timed("dedupe", lambda: salesforce_month_report.dedupe_surveys(rawsurv))
+    timed("survey", lambda: salesforce_month_report.survey_report(rawsurv, year, month, case_data.get("Close Cases", 0)))
+    return stages, rawcase, rawsurv, report_cases, report_survy
+
+
+def run_report(folder, args):
+    """
+    在子进程中运行 salesforce_month_report.py, 并获取运行时间和内存峰值
+    :param folder: 报告所在的文件夹, 也是子进程的工作目录
+    :param args: salesforce_month_report.py 的参数
+    :return: dict, keys: seconds / peak_rss_kb / returncode
+    """
+    start = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, REPORT_SCRIPT] + args, cwd=folder, stdout=subprocess.DEVNULL)
+    # os.wait4 可以获取单个子进程的资源使用情况, ru_maxrss 在 Linux 中的单位是 KB
+    if hasattr(os, "wait4"):
+        _, status, usage = os.wait4(proc.pid, 0)
+        proc.returncode = os.waitstatus_to_exitcode(status)
+        peak_rss_kb_child = usage.ru_maxrss
+    else:
+        proc.wait()
+        peak_rss_kb_child = None
+    return {"seconds": round(time.perf_counter() - start, 4), "peak_rss_kb": peak_rss_kb_child, "returncode": proc.returncode}
+
+
+def cli_month(months):
+    """
+    脚本按照当前时间计算月份, 选择一个会计算 KPI 的月份作为脚本的参数
+    当前就是基准月份时使用基准月份, 否则使用基准月份的上一个月, 这样两边都不是当月, KPI 可以直接比对
+    :param months: 计算 KPI 的月份数量
+    :return: (月份偏移, "<year>-<month>"), 没有合适的月份时为 (None, None)
+    """
+    now = pd.Timestamp.now()
+    ref_offset = (REFERENCE_TIME.year - now.year) * 12 + REFERENCE_TIME.month - now.month
+    period = pd.Period(REFERENCE_TIME, freq="M")
+    if ref_offset == 0:
+        return 0, "{}-{}".format(period.year, period.month)
+    if ref_offset > 0 or months < 2:
+        return None, None
+    period = period - 1
+    return ref_offset - 1, "{}-{}".format(period.year, period.month)
+
+
+def read_month_csv(filename):
+    """
+    读取脚本输出的 <year>-<month>.csv, 值保持为字符串
+    :param filename:
+    :return: dict, KPI -> 值
+    """
+    with open(filename, "r", newline="", encoding="utf-8") as f:
+        rows = list(csv.reader(f))
+    return {row[0]: row[1] for row in rows[1:]}
+
+
+def month_kpis(rawcase, rawsurv, months):
+    """
+    计算基准月份以及之前几个月的 KPI, 只有基准月份为当月
+    :param rawcase:
+    :param rawsurv:
+    :param months: 月份的数量
+    :return: dict, "<year>-<month>" -> KPI 字典
+    """
+    kpis = {}
+    for period in pd.period_range(end=pd.Period(REFERENCE_TIME, freq="M"), periods=months, freq="M")[::-1]:
+        current_month = period == pd.Period(REFERENCE_TIME, freq="M")
+        summary_data = salesforce_month_report.month_report(rawcase, rawsurv, period.year, period.month, current_month)
+        # 统一转换为字符串, 和写入到 csv 中的值一致
+        kpis["{}-{}".format(period.year, period.month)] = {k: str(v) for k, v in summary_data.items()}
+    return kpis
+
+
+def compare_kpis(expected, actual):
+    """
+    对比 KPI
+    :param expected: dict, "<year>-<month>" -> KPI 字典
+    :param actual:
+    :return: list, 不一致的 [月份, KPI, 期望值, 实际值]
+    """
+    mismatches = []
+    for month in expected:
+        for kpi in list(dict.fromkeys(list(expected.get(month, {})) + list(actual.get(month, {})))):
+            if expected.get(month, {}).get(kpi) != actual.get(month, {}).get(kpi):
+                mismatches.append([month, kpi, expected.get(month, {}).get(kpi), actual.get(month, {}).get(kpi)])
+    return mismatches
+
+
+def check_golden(kpis, golden_file, params, update):
+    """
+    对比 KPI 和 golden 值, 指定了更新时保存当前的 KPI, golden 文件不存在时视为失败
+    :param kpis: 当前的 KPI
+    :param golden_file:
+    :param params: 生成报告的参数, 参数不一致时不对比
+    :param update: 是否更新 golden 文件
+    :return: dict, keys: status / file / mismatches
+    """
+    if update:
+        with open(golden_file, "w") as f:
+            json.dump({"params": params, "kpis": kpis}, f, indent=2)
+            f.write("\n")
+        print("[INFO] Golden KPI is saved to: {}".format(os.path.abspath(golden_file)))
+        return {"status": "saved", "file": os.path.abspath(golden_file), "mismatches": []}
+    # 没有 golden 值时无法确认 KPI 是否正确, 不能当作通过
+    if not os.path.exists(golden_file):
+        print("[ERROR] Golden KPI file is not found: {}, use -update-golden to create it after the KPI are confirmed.".format(os.path.abspath(golden_file)))
+        return {"status": "failed", "file": os.path.abspath(golden_file), "mismatches": []}
+
+    with open(golden_file, "r") as f:
+        golden = json.load(f)
+    if golden.get("params") != params:
+        print("[WARN] Golden KPI is generated by different parameters, will ignore: {}".format(golden.get("params")))
+        return {"status": "skipped", "file": os.path.abspath(golden_file), "mismatches": []}
+    mismatches = compare_kpis(golden.get("kpis"), kpis)
+    for month, kpi, expected, actual in mismatches:
+        print("[ERROR] Golden KPI mismatch: {} {}, expected {}, actual {}".format(month, kpi, expected, actual))
+    if not mismatches:
+        print("[INFO] Golden KPI passed, {} months checked.".format(len(golden.get("kpis"))))
+    return {"status": "failed" if mismatches else "passed", "file": os.path.abspath(golden_file), "mismatches": mismatches}
+
+
+def git_commit():
+    """
+    获取当前的 git commit, 用于对比不同版本的测试结果
+    :return: str or None
+    """
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=os.path.dirname(REPORT_SCRIPT),
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return None
+
+
+def run_bench(args_dict):
+    """
+    生成测试用的报告并运行测试, 结果保存为 JSON
+    :param args_dict:
+    :return: bool, 脚本运行和 KPI 检查是否通过
+    """
+    work_folder = os.path.abspath(args_dict.get("args_dst_folder"))
+    os.makedirs(work_folder, exist_ok=True)
+    cases = args_dict.get("args_cases")
+    seed = args_dict.get("args_seed")
+    folder = prepare_reports(work_folder, cases, seed)
+    year, month = REFERENCE_TIME.year, REFERENCE_TIME.month
+    results = {
+        "commit": git_commit(),
+        "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "cases": cases,
+        "seed": seed,
+        "reference": str(REFERENCE_TIME),
+        "report_bytes": {x: os.path.getsize(os.path.join(folder, x)) for x in ["report1.csv", "report2.csv"]},
+    }
+
+    # 完整运行脚本的时间和内存峰值, 输出的 KPI 在后面和 golden 检查过的 KPI 比对
+    # 子进程的 ru_maxrss 会包含 fork 时当前进程的内存, 所以必须在当前进程读取报告之前运行
+    results["runs"] = {}
+    month_offset, check_month = cli_month(args_dict.get("args_months"))
+    run_offset = "0" if month_offset is None else str(month_offset)
+    cli_data = {}
+    for name, run_args in [("default", [run_offset, "-no-cache"]), ("stream", [run_offset, "-stream", str(args_dict.get("args_chunk"))])]:
+        output_csv = os.path.join(folder, "{}.csv".format(check_month))
+        if check_month is not None and os.path.exists(output_csv):
+            os.remove(output_csv)
+        results["runs"][name] = run_report(folder, run_args)
+        print("[INFO] run {:<8} {:>10.4f} s {:>10} KB RSS".format(name, results["runs"][name].get("seconds"), results["runs"][name].get("peak_rss_kb")))
+        if results["runs"][name].get("returncode") != 0:
+            print("[ERROR] run {} failed, return code is {}".format(name, results["runs"][name].get("returncode")))
+        elif check_month is not None:
+            cli_data[name] = read_month_csv(output_csv)
+
+    # 各阶段的时间和内存峰值
+    stages, rawcase, rawsurv, report_cases, report_survy = bench_stages(folder, year, month)
+    results["stages"] = stages
+
+    # KPI 检查, 分块模式的结果必须和一次读取的结果一致
+    kpis = month_kpis(rawcase, rawsurv, args_dict.get("args_months"))
+    del rawcase, rawsurv
+    current = "{}-{}".format(year, month)
+    stream_data = salesforce_month_report.stream_report(report_cases, report_survy, year, month, True, args_dict.get("args_chunk"))
+    stream_mismatches = compare_kpis({current: kpis.get(current)}, {current: {k: str(v) for k, v in stream_data.items()}})
+    for month_name, kpi, expected, actual in stream_mismatches:
+        print("[ERROR] Stream KPI mismatch: {} {}, expected {}, actual {}".format(month_name, kpi, expected, actual))
+    results["stream_check"] = {"status": "failed" if stream_mismatches else "passed", "mismatches": stream_mismatches}
+    golden_file = args_dict.get("args_golden")
+    if golden_file == "Null":
+        golden_file = GOLDEN_FILE
+    golden_params = {"cases": cases, "seed": seed, "months": args_dict.get("args_months"), "reference": str(REFERENCE_TIME)}
+    results["golden_check"] = check_golden(kpis, golden_file, golden_params, args_dict.get("args_update_golden"))
+    # kpis 已经和 golden 值比对过, 脚本输出的 KPI 和 kpis 一致即和 golden 值一致
+    cli_mismatches = []
+    for name, data in cli_data.items():
+        for month_name, kpi, expected, actual in compare_kpis({check_month: kpis.get(check_month)}, {check_month: data}):
+            print("[ERROR] Script {} KPI mismatch: {} {}, expected {}, actual {}".format(name, month_name, kpi, expected, actual))
+            cli_mismatches.append([name, month_name, kpi, expected, actual])
+    failed_runs = [name for name, run in results["runs"].items() if run.get("returncode") != 0]
+    if check_month is None:
+        print("[WARN] Reference month is not in the checked months, KPI written by the script are not checked.")
+    results["cli_check"] = {"status": "failed" if failed_runs or cli_mismatches else ("passed" if check_month is not None else "skipped"),
+                            "month": check_month, "failed_runs": failed_runs, "mismatches": cli_mismatches}
+    results["kpis"] = kpis
+
+    output = args_dict.get("args_output")
+    if output == "Null":
+        output = os.path.join(work_folder, "bench_{}.json".format(time.strftime("%Y%m%d_%H%M%S")))
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print("[INFO] Benchmark result is saved to: {}".format(os.path.abspath(output)))
+    return results["stream_check"].get("status") == "passed" and results["golden_check"].get("status") != "failed" \
+        and results["cli_check"].get("status") != "failed"
+
+
+if __name__ == "__main__":
+    checked = check_args(sys.argv)
+    if checked.get("mode") == "help":
+        print(
+            "\n",
+            "Usage:\n",
+            "   bench_salesforce_month_report.py -d <work folder> [-o <result json>] [-cases N] [-seed N] [-months N] [-chunk N] [-golden <json>] [-update-golden]\n",
+            "\n",
+            "args:\n",
+            "# -d              Folder used to save synthetic reports, reports are reused if parameters are not changed\n",
+            "# -o              Save benchmark result to this JSON file, default is <work folder>/bench_<time>.json\n",
+            "# -cases          Number of cases in synthetic case report, default is 20000\n",
+            "# -seed           Random seed of synthetic reports, default is 0\n",
+            "# -months         Check KPI of reference month (2026-10) and previous months, default is 3\n",
+            "# -chunk          Rows per chunk used by stream mode, default is 100000\n",
+            "# -golden         Golden KPI JSON file, default is bench_salesforce_month_report_golden.json beside this script, a missing file fails the check\n",
+            "# -update-golden  Save current KPI as golden values, use it only after the KPI change is confirmed\n",
+        )
+    elif not run_bench(checked):
+        sys.exit(1)
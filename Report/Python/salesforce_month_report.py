@@ -3,8 +3,8 @@
 
 ########################################################################################################################
 #   author: zhanghong.personal@outlook.com
-#  version: 1.4
-#    usage: salesforce_month_report.py [month offset, like -1, -2, -3...] [-debug]
+#  version: 2.3
+#    usage: salesforce_month_report.py [month offset, like -1, -2, -3...] [-debug] [-debug-zip] [-no-cache] [-cache-dir <folder>] [-range <months>] [-owner] [-stream <rows>] [-watch <seconds>]
 # release nodes:
 #   2024.05.07 - first release
 #   2024.05.15 - add debug function and change algorithms
@@ -12,277 +12,1057 @@
 #   2024.06.02 - fix backlog & survey related algorithms
 #   2024.07.01 - csv encoding issue will be ignored
 #   2025.01.02 - fix UnicodeDecodeError issue, will ignored it
+#   2026.10.18 - only load required columns, cache parsed reports in ./cache or the folder given by -cache-dir
+#   2026.10.18 - add -range mode, calculate KPI trend of several months in one pass
+#   2026.10.18 - add -owner mode, calculate KPI by Case Owner in one grouped pass
+#   2026.10.18 - add -stream mode, read reports by chunks with bounded memory
+#   2026.10.18 - can be imported as a library, command line moved to main()
+#   2026.10.18 - add -watch mode, only reload changed report and rewrite result atomically
+#   2026.10.18 - debug data is recorded by row index and written to ./debug in one batch, -debug-zip for one zip file
+#   2026.10.18 - split backlog / DTR calculation into functions, benchmark by bench_salesforce_month_report.py
+#   2026.10.18 - parse fixed width time by byte position, DTR is calculated by datetime64 instead of python date
 ########################################################################################################################
 
 import re
 import os
 import sys
+import glob
+import time
+import zipfile
+import threading
+import hashlib
+import importlib.util
+import numpy as np
 import pandas as pd
 from prettytable import PrettyTable
 
-# 定义全局变量
-table = PrettyTable()
-summary_data = []
-report_cases = None
-report_survy = None
-report_miss_cases = []
-report_miss_survy = []
-open_cases_by_month = None
-clos_cases_by_month = None
-
-# 定义偏移量, 如果不写默认是 0
-# noinspection PyBroadException
-try:
-    month_offset = int(sys.argv[1])
-except:
-    month_offset = 0
-
-# 是否开启 debug
-debug = False
-for key in sys.argv:
-    if key == "-debug":
-        debug = True
-
-
-def show_debug(filename, pdata, columns=None):
-    """
-    debug 输出的原始数据
+# 缓存优先使用 feather 列式存储, 需要安装 pyarrow, 否则使用 pickle
+cache_ext = ".feather" if importlib.util.find_spec("pyarrow") is not None else ".pkl"
+
+# 分块模式默认每次读取的行数
+DEFAULT_STREAM_ROWS = 100000
+# 监控模式默认的轮询间隔 (秒)
+DEFAULT_WATCH_INTERVAL = 1.0
+
+# 报告中需要的列
+head_by_cases = [
+    "Case Owner",
+    "Case Number",
+    "Date/Time Opened",
+    # "Closed Date",
+    "Date/Time Closed",
+    "Age (Days)",
+    "Suggested_Solution_Date",
+    "Status", "Knowledge Base Article",
+    "Idol Knowledge Link",
+    "R&D Incident",
+    "Escalated",
+]
+head_by_survy = [
+    "Case Owner",
+    "Case Number",
+    # "Closed Data",
+    "Customer Feed Back Survey: Last Modified Date",
+    "OpenText made it easy to handle my case",
+    "Satisfied with support experience",
+]
+# 列的数据类型, 时间列先按照字符串读取, 再按照指定的格式解析
+dtype_by_cases = {
+    "Case Owner": "category",
+    "Case Number": str,
+    "Date/Time Opened": str,
+    "Date/Time Closed": str,
+    "Age (Days)": "float64",
+    "Suggested_Solution_Date": str,
+    "Status": "category",
+    "Knowledge Base Article": str,
+    "Idol Knowledge Link": str,
+    "R&D Incident": str,
+    "Escalated": "float64",
+}
+dtype_by_survy = {
+    "Case Owner": "category",
+    "Case Number": str,
+    "Customer Feed Back Survey: Last Modified Date": str,
+    "OpenText made it easy to handle my case": "float64",
+    "Satisfied with support experience": "float64",
+}
+date_by_cases = {
+    "Date/Time Opened": "%Y-%m-%d %p%I:%M",
+    "Date/Time Closed": "%Y-%m-%d %p%I:%M",
+    "Suggested_Solution_Date": "%Y-%m-%d %p%I:%M",
+}
+date_by_survy = {
+    "Customer Feed Back Survey: Last Modified Date": "%Y-%m-%d",
+}
+# 固定宽度的时间格式和对应的模板, 0 为数字, A 为 A 或 P (AM/PM), 其他字符必须一致
+fixed_date_formats = {
+    "%Y-%m-%d %p%I:%M": "0000-00-00 AM00:00",
+    "%Y-%m-%d": "0000-00-00",
+}
+
+
+def show_debug(filename, source, index, columns=None, debug=None):
+    """
+    记录需要 debug 输出的原始数据, 计算时只记录行索引和列名, 由 save_debug 在最后统一输出
     :param filename: 输出的文件名
-    :param pdata: pandas 数据
+    :param source: 原始的 pandas 数据, 例如 cases 数据或 survey 数据
+    :param index: 需要输出的行索引
     :param columns: 输出那些列, 默认输出所有列, 接受的是列表形式的数据
+    :param debug: debug 数据的记录列表, 为 None 时不记录
     :return:
     """
-    if debug:
-        if columns is not None:
-            pdata = pdata[columns]
-        pdata = pdata.reset_index(drop=True)
-        pdata.index = pdata.index + 1
-
-        if os.path.exists(r".\debug") is False:
-            os.mkdir(r".\debug")
-        pdata.to_csv(r".\debug\{}".format(filename))
-
-
-# 计算指定的年月
-if pd.Timestamp.now().month + month_offset >= 1:
-    y_offset = pd.Timestamp.now().year
-    m_offset = pd.Timestamp.now().month + month_offset
-elif pd.Timestamp.now().month + month_offset == 0:
-    y_offset = pd.Timestamp.now().year - 1
-    m_offset = 12
-elif pd.Timestamp.now().month + month_offset > -12:
-    y_offset = pd.Timestamp.now().year - 1
-    m_offset = 12 - (abs(pd.Timestamp.now().month + month_offset) % 12)
-else:
-    y_offset = pd.Timestamp.now().year - (abs(pd.Timestamp.now().month + month_offset) // 12) - 1
-    m_offset = 12 - (abs(pd.Timestamp.now().month + month_offset) % 12)
-
-# 生成表头
-table.field_names = ["KPI", "{}-{}".format(str(y_offset), str(m_offset))]
-
-# 检查原始报告是否符合要求
-for i in os.listdir(os.path.abspath("./")):
-    if re.findall(r"report\d+.csv", i, re.IGNORECASE):
-        with open(i, mode="r", encoding="utf-8", errors="ignore") as f:
-            heads = f.readline().strip().replace('"', '').split(",")
-            # 检查是否符合 cases 报告
-            head_by_cases = [
-                "Case Owner",
-                "Case Number",
-                "Date/Time Opened",
-                # "Closed Date",
-                "Date/Time Closed",
-                "Age (Days)",
-                "Suggested_Solution_Date",
-                "Status", "Knowledge Base Article",
-                "Idol Knowledge Link",
-                "R&D Incident",
-                "Escalated",
-            ]
-            head_by_survy = [
-                "Case Owner",
-                "Case Number",
-                # "Closed Data",
-                "Customer Feed Back Survey: Last Modified Date",
-                "OpenText made it easy to handle my case",
-                "Satisfied with support experience",
-            ]
-            if all(x in heads for x in head_by_cases):
-                report_cases = i
-            if all(x in heads for x in head_by_survy):
-                report_survy = i
-
-# 分析 Cases Report
-if report_cases is None:
-    print("[WARN] Case report miss columns, will ignore.")
-else:
-    rawcase = pd.read_csv(report_cases, encoding="utf-8", encoding_errors='ignore')
-    # 数据预处理
-    rawcase["Date/Time Opened"] = pd.to_datetime(rawcase["Date/Time Opened"], format="%Y-%m-%d %p%I:%M")
-    rawcase["Date/Time Closed"] = pd.to_datetime(rawcase["Date/Time Closed"], format="%Y-%m-%d %p%I:%M")
-    rawcase["Suggested_Solution_Date"] = pd.to_datetime(rawcase["Suggested_Solution_Date"], format="%Y-%m-%d %p%I:%M")
-    # 根据年份和月份筛选数据
-    open_cases_y = rawcase[rawcase["Date/Time Opened"].dt.year == y_offset]
-    open_cases_m = open_cases_y[open_cases_y["Date/Time Opened"].dt.month == m_offset]
-    close_cases_y = rawcase[rawcase["Date/Time Closed"].dt.year == y_offset]
-    close_cases_m = close_cases_y[close_cases_y["Date/Time Closed"].dt.month == m_offset]
-    # 赋值给共享变量, 这些值会用于其他的报表
-    if len(open_cases_m) != 0:
-        open_cases_by_month = open_cases_m
-    if len(close_cases_m) != 0:
-        clos_cases_by_month = close_cases_m
+    if debug is not None:
+        debug.append((filename, source, index, columns))
+
+
+def write_debug(debug, folder, archive):
+    """
+    输出所有记录的 debug 数据
+    :param debug: debug 数据的记录列表
+    :param folder: 输出的目录
+    :param archive: 是否输出为一个 zip 文件, 每个 csv 为其中的一个文件
+    :return:
+    """
+    if os.path.exists(folder) is False:
+        os.makedirs(folder)
+    zip_file = zipfile.ZipFile(os.path.join(folder, "debug.zip"), mode="w", compression=zipfile.ZIP_DEFLATED) if archive else None
+    try:
+        for filename, source, index, columns in debug:
+            pdata = source.loc[index] if columns is None else source.loc[index, columns]
+            pdata = pdata.reset_index(drop=True)
+            pdata.index = pdata.index + 1
+            if zip_file is not None:
+                zip_file.writestr(filename, pdata.to_csv())
+            else:
+                pdata.to_csv(os.path.join(folder, filename))
+    finally:
+        if zip_file is not None:
+            zip_file.close()
+
+
+def save_debug(debug, folder=os.path.join(".", "debug"), archive=False, background=False):
+    """
+    统一输出 debug 数据
+    :param debug: debug 数据的记录列表
+    :param folder: 输出的目录
+    :param archive: 是否输出为一个 zip 文件
+    :param background: 是否在后台线程中输出, 返回线程, 需要时由调用者 join
+    :return: 后台线程或 None
+    """
+    if not debug:
+        return None
+    if background:
+        thread = threading.Thread(target=write_debug, args=(list(debug), folder, archive))
+        thread.start()
+        return thread
+    write_debug(debug, folder, archive)
+    return None
+
+
+def parse_dates(pdata, dates):
+    """
+    按照指定的格式解析时间列
+    :param pdata: pandas 数据
+    :param dates: 时间列和对应的格式
+    :return: pandas 数据
+    """
+    for column, date_format in dates.items():
+        pdata[column] = parse_fixed_dates(pdata[column], date_format)
+    return pdata
+
+
+def parse_fixed_dates(column, date_format):
+    """
+    按照固定的宽度解析时间, 每个字段直接按照字节位置计算, 不需要逐个字符串匹配格式
+    不是固定宽度的格式, 或者存在不符合格式的值时, 使用 pd.to_datetime 解析
+    :param column: 字符串类型的列
+    :param date_format: 时间的格式
+    :return: datetime64[ns] 类型的列
+    """
+    template = fixed_date_formats.get(date_format)
+    if template is None or not pd.api.types.is_string_dtype(column.dtype):
+        return pd.to_datetime(column, format=date_format)
+    width = len(template)
+    missing = column.isna().to_numpy()
+    # 多读取一个字节, 用于判断是否有超出宽度的值
+    try:
+        raw = column[~missing].to_numpy(dtype="S{}".format(width + 1))
+    except (UnicodeEncodeError, ValueError, TypeError):
+        return pd.to_datetime(column, format=date_format)
+    chars = raw.view(np.uint8).reshape(-1, width + 1)
+    digits = chars.astype(np.int16) - ord("0")
+
+    def field(start, end):
+        value = np.zeros(len(chars), dtype=np.int64)
+        for i in range(start, end):
+            value = value * 10 + digits[:, i]
+        return value
+
+    valid = chars[:, width] == 0
+    for i, char in enumerate(template):
+        if char == "0":
+            valid &= (digits[:, i] >= 0) & (digits[:, i] <= 9)
+        elif char == "A":
+            valid &= (chars[:, i] == ord("A")) | (chars[:, i] == ord("P"))
+        else:
+            valid &= chars[:, i] == ord(char)
+    year = field(0, 4)
+    month = field(5, 7)
+    day = field(8, 10)
+    valid &= (month >= 1) & (month <= 12) & (day >= 1)
+    if width > 10:
+        hour = field(13, 15)
+        minute = field(16, 18)
+        valid &= (hour >= 1) & (hour <= 12) & (minute <= 59)
+    if not valid.all():
+        return pd.to_datetime(column, format=date_format)
+
+    month_start = ((year - 1970) * 12 + month - 1).astype("datetime64[M]")
+    values = month_start.astype("datetime64[ns]") + (day - 1).astype("timedelta64[D]")
+    # 日期超出当月的天数 (例如 02-30) 时交给 pd.to_datetime 处理
+    if (values.astype("datetime64[M]") != month_start).any():
+        return pd.to_datetime(column, format=date_format)
+    if width > 10:
+        # AM12 为 0 点, PM12 为 12 点
+        hour = hour % 12 + np.where(chars[:, 11] == ord("P"), 12, 0)
+        values = values + hour.astype("timedelta64[h]") + minute.astype("timedelta64[m]")
+
+    result = np.full(len(column), np.datetime64("NaT"), dtype="datetime64[ns]")
+    result[~missing] = values
+    return pd.Series(result, index=column.index, name=column.name)
+
+
+def load_report(filename, columns, dtypes, dates, use_cache=True, cache_dir=os.path.join(".", "cache")):
+    """
+    读取报告中需要的列并解析时间, 结果缓存在 cache_dir 中
+    缓存以报告的路径/大小/修改时间作为 key, 报告没有变化时直接读取缓存, 不再解析 csv
+    :param filename: 报告的文件名
+    :param columns: 需要读取的列
+    :param dtypes: 列的数据类型
+    :param dates: 时间列和对应的格式
+    :param use_cache: 是否使用缓存
+    :param cache_dir: 缓存目录
+    :return: pandas 数据
+    """
+    st = os.stat(filename)
+    path = os.path.abspath(filename)
+    key = "{}|{}|{}|{}|{}|{}".format(path, st.st_size, st.st_mtime_ns, columns, dtypes, dates)
+    # 缓存文件名包含报告绝对路径的 hash 值, 不同目录中的同名报告不会互相覆盖
+    cache_prefix = "{}.{}".format(os.path.basename(filename), hashlib.sha1(path.encode("utf-8", "surrogateescape")).hexdigest()[:16])
+    cache_file = os.path.join(cache_dir, "{}.{}{}".format(cache_prefix, hashlib.sha1(key.encode("utf-8", "surrogateescape")).hexdigest()[:16], cache_ext))
+    if use_cache and os.path.exists(cache_file):
+        # 缓存只是优化, 读取失败(例如写入时被中断)时重新解析 csv
+        try:
+            if cache_ext == ".feather":
+                return pd.read_feather(cache_file)
+            return pd.read_pickle(cache_file)
+        except Exception as e:
+            print("[WARN] Can't read cache {}, reason is: {}, parse the report again.".format(cache_file, e))
+
+    pdata = parse_dates(pd.read_csv(filename, usecols=columns, dtype=dtypes, encoding="utf-8", encoding_errors='ignore'), dates)
+
+    if use_cache:
+        try:
+            # 删除同一个路径的报告过期的缓存
+            for old_file in glob.glob(os.path.join(glob.escape(cache_dir), "{}.*".format(glob.escape(cache_prefix)))):
+                os.remove(old_file)
+            if os.path.exists(cache_dir) is False:
+                os.makedirs(cache_dir)
+            # 先写入临时文件再替换, 中途被中断时不会留下不完整的缓存
+            if cache_ext == ".feather":
+                pdata.to_feather(cache_file + ".tmp")
+            else:
+                pdata.to_pickle(cache_file + ".tmp")
+            os.replace(cache_file + ".tmp", cache_file)
+        except OSError as e:
+            print("[WARN] Can't write cache {}, reason is: {}".format(cache_file, e))
+    return pdata
+
+
+def percent(numerator, denominator):
+    """
+    计算百分比, 格式和单月报告一致, 分母为 0 时返回 "-"
+    :param numerator:
+    :param denominator:
+    :return: str
+    """
+    if denominator == 0:
+        return "-"
+    return str(round(numerator / denominator * 100, 2)) + "%"
+
+
+def trend_report(rawcase, rawsurv, months):
+    """
+    一次分组计算多个月份的 KPI, 不需要每个月份单独筛选数据
+    :param rawcase: cases 数据, 为 None 时不计算 cases 相关的 KPI
+    :param rawsurv: survey 数据 (已按照 Case Number 去重), 为 None 时不计算 survey 相关的 KPI
+    :param months: pd.PeriodIndex, 需要计算的月份
+    :return: pandas 数据, 行为 KPI, 列为月份
+    """
+    trend = {}
+    close_cnt = pd.Series(0, index=months)
+    if rawcase is not None:
+        # 每个 case 只计算一次所属的月份, 再按照月份分组汇总
+        opened = pd.DataFrame({
+            "month": rawcase["Date/Time Opened"].dt.to_period("M"),
+            "escalated": rawcase["Escalated"] != 0,
+        }).groupby("month").agg(open=("escalated", "size"), escalated=("escalated", "sum")).reindex(months, fill_value=0)
+        closed = pd.DataFrame({
+            "month": rawcase["Date/Time Closed"].dt.to_period("M"),
+            "rd": rawcase["R&D Incident"].notna(),
+            "kcs": rawcase["Knowledge Base Article"].notna() | rawcase["Idol Knowledge Link"].notna(),
+        }).groupby("month").agg(close=("rd", "size"), rd=("rd", "sum"), kcs=("kcs", "sum")).reindex(months, fill_value=0)
+        close_cnt = closed["close"]
+        trend["Open Cases"] = opened["open"]
+        trend["Close Cases"] = closed["close"]
+        trend["Closure Rate"] = [percent(c, o) for c, o in zip(closed["close"], opened["open"])]
+        trend["R&D Assist Rate"] = [percent(r, c) for r, c in zip(closed["rd"], closed["close"])]
+        trend["KCS Linkage"] = [percent(k, c) for k, c in zip(closed["kcs"], closed["close"])]
+        trend["Escalated"] = [str(e) if o != 0 else "-" for e, o in zip(opened["escalated"], opened["open"])]
+    if rawsurv is not None:
+        survey = pd.DataFrame({
+            "month": rawsurv["Customer Feed Back Survey: Last Modified Date"].dt.to_period("M"),
+            "ces": (rawsurv["OpenText made it easy to handle my case"] >= 8.0) | rawsurv["OpenText made it easy to handle my case"].isna(),
+            "cast": (rawsurv["Satisfied with support experience"] >= 8.0) | rawsurv["Satisfied with support experience"].isna(),
+        }).groupby("month").agg(survey=("ces", "size"), ces=("ces", "sum"), cast=("cast", "sum")).reindex(months, fill_value=0)
+        trend["Survey CES"] = [percent(c, n) for c, n in zip(survey["ces"], survey["survey"])]
+        trend["Survey CAST"] = [percent(c, n) for c, n in zip(survey["cast"], survey["survey"])]
+        trend["Survey Response Rate"] = [percent(n, c) if n > 0 else "-" for n, c in zip(survey["survey"], close_cnt)]
+    columns = ["{}-{}".format(m.year, m.month) for m in months]
+    return pd.DataFrame({kpi: list(values) for kpi, values in trend.items()}, index=columns).T
+
+
+def case_flags(rawcase, year, month):
+    """
+    计算每个 case 在指定月份的 KPI 标记, 汇总这些标记即可得到 KPI 的分子和分母
+    :param rawcase: cases 数据
+    :param year:
+    :param month:
+    :return: pandas 数据, 每行对应一个 case
+    """
+    # 下个月开始的时间点
+    next_month = pd.Timestamp(year, month, 1) + pd.offsets.MonthEnd() + pd.offsets.DateOffset()
+    opened = rawcase["Date/Time Opened"]
+    closed = rawcase["Date/Time Closed"]
+    open_m = (opened.dt.year == year) & (opened.dt.month == month)
+    close_m = (closed.dt.year == year) & (closed.dt.month == month)
+    rd = rawcase["R&D Incident"].notna()
+    backlog = (rawcase["Status"] != "Closed") & (opened < next_month)
+    backlog_history = (rawcase["Status"] == "Closed") & (closed >= next_month) & (opened < next_month)
+    # DTR: 设置过 SS 的为 SS 和创建日期相差的天数, 否则为 Age (Days)
+    # 和单月报告一致, backlog 和当月创建的 case 合并后没有去重, 所以同时满足两个条件的 case 计算两次
+    ss = rawcase["Suggested_Solution_Date"]
+    dtr = (ss.dt.normalize() - opened.dt.normalize()).dt.days.where(ss.notna(), rawcase["Age (Days)"])
+    dtr_weight = backlog.astype("int64") + open_m.astype("int64")
+    return pd.DataFrame({
+        "Case Owner": rawcase["Case Owner"],
+        "open": open_m,
+        "close": close_m,
+        "rd": close_m & rd,
+        "kcs": close_m & (rawcase["Knowledge Base Article"].notna() | rawcase["Idol Knowledge Link"].notna()),
+        "escalated": open_m & (rawcase["Escalated"] != 0),
+        "backlog": backlog,
+        "backlog_total": backlog | backlog_history,
+        "backlog30": backlog & (rawcase["Age (Days)"] > 30.0),
+        "backlog30_support": backlog & (rawcase["Age (Days)"] > 30.0) & ~rd,
+        "backlog90": backlog & (rawcase["Age (Days)"] > 90.0),
+        "dtr_count": dtr_weight,
+        "dtr_sum": (dtr * dtr_weight).fillna(0.0),
+        "dtr_support_count": dtr_weight * ~rd,
+        "dtr_support_sum": (dtr * dtr_weight * ~rd).fillna(0.0),
+    })
+
+
+def survey_flags(rawsurv, year, month):
+    """
+    计算每个 survey 在指定月份的 KPI 标记
+    :param rawsurv: survey 数据 (已按照 Case Number 去重)
+    :param year:
+    :param month:
+    :return: pandas 数据, 每行对应一个 survey
+    """
+    modified = rawsurv["Customer Feed Back Survey: Last Modified Date"]
+    survey_m = (modified.dt.year == year) & (modified.dt.month == month)
+    ces = rawsurv["OpenText made it easy to handle my case"]
+    cast = rawsurv["Satisfied with support experience"]
+    return pd.DataFrame({
+        "Case Owner": rawsurv["Case Owner"],
+        "survey": survey_m,
+        "ces": survey_m & ((ces >= 8.0) | ces.isna()),
+        "cast": survey_m & ((cast >= 8.0) | cast.isna()),
+    })
+
+
+def owner_report(rawcase, rawsurv, year, month, current_month):
+    """
+    按照 Case Owner 一次分组计算指定月份的所有 KPI, 不需要逐个负责人筛选数据
+    :param rawcase: cases 数据, 为 None 时不计算 cases 相关的 KPI
+    :param rawsurv: survey 数据 (已按照 Case Number 去重), 为 None 时不计算 survey 相关的 KPI
+    :param year:
+    :param month:
+    :param current_month: 是否为当月, 只有当月才会计算 Backlog 相关的百分比和 DTR
+    :return: pandas 数据, 行为 Case Owner, 列为 KPI
+    """
+    counts = []
+    if rawcase is not None:
+        counts.append(case_flags(rawcase, year, month).groupby("Case Owner", observed=True).sum())
+    if rawsurv is not None:
+        counts.append(survey_flags(rawsurv, year, month).groupby("Case Owner", observed=True).sum())
+
+    # cases 和 survey 中的负责人可能不一致, 合并后缺失的值为 0
+    counts = pd.concat([x.set_axis(x.index.astype(str)) for x in counts], axis=1).fillna(0).sort_index()
+    result = pd.DataFrame(index=counts.index)
+    if rawcase is not None:
+        result["Open Cases"] = counts["open"].astype("int64")
+        result["Close Cases"] = counts["close"].astype("int64")
+        result["Closure Rate"] = [percent(c, o) for c, o in zip(counts["close"], counts["open"])]
+        result["R&D Assist Rate"] = [percent(r, c) for r, c in zip(counts["rd"], counts["close"])]
+        result["Backlog"] = counts["backlog_total"].astype("int64")
+        if current_month:
+            result["Backlog > 30"] = [percent(b, t) for b, t in zip(counts["backlog30"], counts["backlog_total"])]
+            result["Backlog > 30 (Support)"] = [percent(b, t) for b, t in zip(counts["backlog30_support"], counts["backlog_total"])]
+            result["Backlog > 90"] = [percent(b, t) for b, t in zip(counts["backlog90"], counts["backlog_total"])]
+            result["DTR"] = [str(round(d / n, 2)) if n != 0 else "-" for d, n in zip(counts["dtr_sum"], counts["dtr_count"])]
+            # 和单月报告一致, 分母为所有 DTR 数据的数量
+            result["DTR Support only"] = [str(round(d / n, 2)) if s != 0 else "-"
+                                          for d, s, n in zip(counts["dtr_support_sum"], counts["dtr_support_count"], counts["dtr_count"])]
+        else:
+            result["Backlog > 30"] = "-"
+            result["Backlog > 30 (Support)"] = "-"
+            result["Backlog > 90"] = "-"
+            result["DTR"] = "-"
+        result["Backlog Index"] = [percent(b, o) for b, o in zip(counts["backlog"], counts["open"])]
+        result["KCS Linkage"] = [percent(k, c) for k, c in zip(counts["kcs"], counts["close"])]
+        result["Escalated"] = [str(int(e)) if o != 0 else "-" for e, o in zip(counts["escalated"], counts["open"])]
+    if rawsurv is not None:
+        result["Survey CES"] = [percent(c, n) for c, n in zip(counts["ces"], counts["survey"])]
+        result["Survey CAST"] = [percent(c, n) for c, n in zip(counts["cast"], counts["survey"])]
+        close_cnt = counts["close"] if rawcase is not None else [0] * len(counts)
+        result["Survey Response Rate"] = [percent(n, c) if n > 0 else "-" for n, c in zip(counts["survey"], close_cnt)]
+    return result
+
+
+def stream_report(case_file, surv_file, year, month, current_month, chunk_size):
+    """
+    分块读取报告并累加 KPI 标记, 内存占用只和分块的大小有关, 结果和单月报告一致
+    survey 按照 Case Number 保留最后修改的记录, 每个 case 只保存修改时间和 KPI 标记
+    :param case_file: cases 报告, 为 None 时不计算 cases 相关的 KPI
+    :param surv_file: survey 报告, 为 None 时不计算 survey 相关的 KPI
+    :param year:
+    :param month:
+    :param current_month: 是否为当月, 只有当月才会计算 Backlog 相关的百分比和 DTR
+    :param chunk_size: 每次读取的行数
+    :return: KPI 字典, 和单月报告一致
+    """
+    result = {}
+    close = 0
+    if case_file is not None:
+        counts = None
+        for chunk in pd.read_csv(case_file, usecols=head_by_cases, dtype=dtype_by_cases, encoding="utf-8", encoding_errors='ignore', chunksize=chunk_size):
+            flags = case_flags(parse_dates(chunk, date_by_cases), year, month).drop(columns="Case Owner").sum()
+            counts = flags if counts is None else counts + flags
+        close = counts["close"]
+        result["Open Cases"] = int(counts["open"])
+        result["Close Cases"] = int(counts["close"])
+        result["Closure Rate"] = percent(counts["close"], counts["open"])
+        result["R&D Assist Rate"] = percent(counts["rd"], counts["close"])
+        result["Backlog"] = int(counts["backlog_total"])
+        if current_month:
+            result["Backlog > 30"] = percent(counts["backlog30"], counts["backlog_total"])
+            result["Backlog > 30 (Support)"] = percent(counts["backlog30_support"], counts["backlog_total"])
+            result["Backlog > 90"] = percent(counts["backlog90"], counts["backlog_total"])
+            result["DTR"] = str(round(counts["dtr_sum"] / counts["dtr_count"], 2)) if counts["dtr_count"] != 0 else "-"
+            # 和单月报告一致, 分母为所有 DTR 数据的数量
+            result["DTR Support only"] = str(round(counts["dtr_support_sum"] / counts["dtr_count"], 2)) if counts["dtr_support_count"] != 0 else "-"
+        else:
+            result["Backlog > 30"] = "-"
+            result["Backlog > 30 (Support)"] = "-"
+            result["Backlog > 90"] = "-"
+            result["DTR"] = "-"
+        result["Backlog Index"] = percent(counts["backlog"], counts["open"])
+        result["KCS Linkage"] = percent(counts["kcs"], counts["close"])
+        if counts["open"] != 0:
+            result["Escalated"] = str(int(counts["escalated"]))
+    if surv_file is not None:
+        # Case Number -> 最后修改的时间和 KPI 标记, 修改时间相同时保留先读到的记录
+        latest = None
+        for chunk in pd.read_csv(surv_file, usecols=head_by_survy, dtype=dtype_by_survy, encoding="utf-8", encoding_errors='ignore', chunksize=chunk_size):
+            chunk = parse_dates(chunk, date_by_survy)
+            flags = survey_flags(chunk, year, month).drop(columns="Case Owner")
+            flags["Case Number"] = chunk["Case Number"]
+            flags["modified"] = chunk["Customer Feed Back Survey: Last Modified Date"]
+            latest = flags if latest is None else pd.concat([latest, flags], ignore_index=True)
+            latest = latest.sort_values(by="modified", ascending=False, kind="stable").drop_duplicates(subset="Case Number")
+        counts = latest[["survey", "ces", "cast"]].sum()
+        if counts["survey"] > 0:
+            result["Survey CES"] = percent(counts["ces"], counts["survey"])
+            result["Survey CAST"] = percent(counts["cast"], counts["survey"])
+            result["Survey Response Rate"] = percent(counts["survey"], close)
+        else:
+            result["Survey CES"] = "-"
+            result["Survey CAST"] = "-"
+            result["Survey Response Rate"] = "-"
+    return result
+
+
+def offset_month(month_offset, now=None):
+    """
+    根据月份的偏移量计算对应的年份和月份
+    :param month_offset: 月份的偏移量, 0 为当月, -1 为上个月, 以此类推
+    :param now: 基准时间, 默认为当前时间
+    :return: (year, month)
+    """
+    if now is None:
+        now = pd.Timestamp.now()
+    if now.month + month_offset >= 1:
+        y_offset = now.year
+        m_offset = now.month + month_offset
+    elif now.month + month_offset == 0:
+        y_offset = now.year - 1
+        m_offset = 12
+    elif now.month + month_offset > -12:
+        y_offset = now.year - 1
+        m_offset = 12 - (abs(now.month + month_offset) % 12)
+    else:
+        y_offset = now.year - (abs(now.month + month_offset) // 12) - 1
+        m_offset = 12 - (abs(now.month + month_offset) % 12)
+    return y_offset, m_offset
+
+
+def report_type(filename):
+    """
+    根据表头检查报告的类型
+    :param filename: 报告的文件名
+    :return: (是否为 cases 报告, 是否为 survey 报告)
+    """
+    with open(filename, mode="r", encoding="utf-8", errors="ignore") as f:
+        heads = f.readline().strip().replace('"', '').split(",")
+    return all(x in heads for x in head_by_cases), all(x in heads for x in head_by_survy)
+
+
+def report_state(folder="."):
+    """
+    获取目录中所有报告的修改时间和大小
+    :param folder: 报告所在的目录
+    :return: 报告 -> (修改时间, 大小), 按照目录中的顺序排列
+    """
+    state = {}
+    for i in os.listdir(os.path.abspath(folder)):
+        if re.findall(r"report\d+.csv", i, re.IGNORECASE):
+            # 报告可能在获取状态前被删除
+            try:
+                st = os.stat(os.path.join(folder, i))
+            except OSError:
+                continue
+            state[os.path.join(folder, i)] = (st.st_mtime_ns, st.st_size)
+    return state
+
+
+def detect_reports(folder="."):
+    """
+    检查目录中的原始报告是否符合要求
+    :param folder: 报告所在的目录
+    :return: (cases 报告, survey 报告), 不存在时为 None
+    """
+    report_cases = None
+    report_survy = None
+    for i in os.listdir(os.path.abspath(folder)):
+        if re.findall(r"report\d+.csv", i, re.IGNORECASE):
+            is_cases, is_survy = report_type(os.path.join(folder, i))
+            if is_cases:
+                report_cases = os.path.join(folder, i)
+            if is_survy:
+                report_survy = os.path.join(folder, i)
+    return report_cases, report_survy
+
+
+def load_cases(filename, use_cache=True, cache_dir=os.path.join(".", "cache")):
+    """
+    读取 cases 报告
+    :param filename: 报告的文件名
+    :param use_cache: 是否使用缓存
+    :param cache_dir: 缓存目录
+    :return: pandas 数据
+    """
+    return load_report(filename, head_by_cases, dtype_by_cases, date_by_cases, use_cache, cache_dir)
+
+
+def load_surveys(filename, use_cache=True, cache_dir=os.path.join(".", "cache")):
+    """
+    读取 survey 报告, 每个 Case Number 只保留最后修改的记录
+    :param filename: 报告的文件名
+    :param use_cache: 是否使用缓存
+    :param cache_dir: 缓存目录
+    :return: pandas 数据
+    """
+    rawsurv = load_report(filename, head_by_survy, dtype_by_survy, date_by_survy, use_cache, cache_dir)
+    # rawsurv["Closed Data"] = pd.to_datetime(rawsurv["Closed Data"], format="%Y-%m-%d")
+    return dedupe_surveys(rawsurv)
+
+
+def dedupe_surveys(rawsurv):
+    """
+    每个 Case Number 只保留最后修改的 survey, 修改时间相同时保留报告中靠前的记录
+    :param rawsurv: survey 数据
+    :return: pandas 数据
+    """
+    # 使用稳定排序, 修改时间相同时的结果不依赖排序算法, 和分块模式一致
+    rawsurv = rawsurv.sort_values(by=["Customer Feed Back Survey: Last Modified Date", ], ascending=False, kind="stable")
+    return rawsurv.drop_duplicates(subset="Case Number")
+
+
+def backlog_cases(rawcase, year, month):
+    """
+    计算指定月份的 backlog
+    :param rawcase: cases 数据
+    :param year:
+    :param month:
+    :return: (月底时仍未关闭的 cases, 月底之后才关闭的 cases)
+    """
     # 计算当前状态下状态为非 Closed 的 cases
-    # 下个月开始时间点为 pd.Timestamp(y_offset, m_offset, 1) + pd.offsets.MonthEnd() + pd.offsets.DateOffset()
+    # 下个月开始时间点为 pd.Timestamp(year, month, 1) + pd.offsets.MonthEnd() + pd.offsets.DateOffset()
     backlog = rawcase[rawcase["Status"] != "Closed"]
-    backlog = backlog[backlog["Date/Time Opened"] < pd.Timestamp(y_offset, m_offset, 1) + pd.offsets.MonthEnd() + pd.offsets.DateOffset()]
+    backlog = backlog[backlog["Date/Time Opened"] < pd.Timestamp(year, month, 1) + pd.offsets.MonthEnd() + pd.offsets.DateOffset()]
     backlog_history = rawcase[rawcase["Status"] == "Closed"]
-    backlog_history = backlog_history[backlog_history["Date/Time Closed"] >= pd.to_datetime("{}-{}".format(y_offset, m_offset, 1), format="%Y-%m") + pd.offsets.MonthEnd() + pd.offsets.DateOffset()]
-    backlog_history = backlog_history[backlog_history["Date/Time Opened"] < pd.Timestamp(y_offset, m_offset, 1) + pd.offsets.MonthEnd() + pd.offsets.DateOffset()]
+    backlog_history = backlog_history[backlog_history["Date/Time Closed"] >= pd.to_datetime("{}-{}".format(year, month, 1), format="%Y-%m") + pd.offsets.MonthEnd() + pd.offsets.DateOffset()]
+    backlog_history = backlog_history[backlog_history["Date/Time Opened"] < pd.Timestamp(year, month, 1) + pd.offsets.MonthEnd() + pd.offsets.DateOffset()]
+    return backlog, backlog_history
+
+
+def dtr_report(rawcase, backlog, open_cases_m, debug=None):
+    """
+    计算 DTR 和 DTR Support only
+    :param rawcase: cases 数据, 用于输出 debug 数据
+    :param backlog: 月底时仍未关闭的 cases
+    :param open_cases_m: 当月创建的 cases
+    :param debug: debug 数据的记录列表, 为 None 时不记录
+    :return: KPI 字典
+    """
+    summary_data = {}
+    # DTR 计算
+    # 未关闭的 case, 分为设置过 SS 和未设置过 SS
+    ssdata_bl_ss = backlog[backlog["Suggested_Solution_Date"].notna()]
+    ssdata_bl_noss = backlog[backlog["Suggested_Solution_Date"].isna()]
+    # 当月开的 case, 分为设置过 SS 和未设置过 SS
+    ssdata_mo_ss = open_cases_m[open_cases_m["Suggested_Solution_Date"].notna()]
+    ssdata_mo_noss = open_cases_m[open_cases_m["Suggested_Solution_Date"].isna()]
+    # 合并所有数据并去重
+    all_data = pd.concat([ssdata_bl_ss, ssdata_bl_noss, ssdata_mo_ss, ssdata_mo_noss])
+    all_data.sort_values(by=["Case Number"], ascending=False)
+    all_data.drop_duplicates(subset="Case Number")
+    # 基于是否设置过 SS 来拆分数据, 此时已经不存在重复的数据了
+    ss_data = all_data[all_data["Suggested_Solution_Date"].notna()]
+    ns_data = all_data[all_data["Suggested_Solution_Date"].isna()]
+    if len(ss_data) != 0 or len(ns_data) != 0:
+        # SS 相关的时间, 按照日期计算相差的天数, 使用整数累加, timedelta64[ns] 累加大量数据时会溢出
+        dtr_ss = (ss_data["Suggested_Solution_Date"].dt.normalize() - ss_data["Date/Time Opened"].dt.normalize()).dt.days
+        # 非 SS 的时间
+        dtr_ns = ns_data["Age (Days)"]
+        # 计算 DTR
+        dtr_avg = (dtr_ss.sum() + dtr_ns.sum()) / len(all_data)
+        dtr_avg = str(round(dtr_avg, 2))
+        summary_data["DTR"] = dtr_avg
+        show_debug("Cases_by_DTR.csv", rawcase, all_data.index, columns=["Case Owner", "Case Number", "Status", "Date/Time Opened", "Suggested_Solution_Date", "R&D Incident", "Age (Days)"], debug=debug)
+    else:
+        summary_data["DTR"] = "-"
+    # DTR only Support
+    all_data_os = all_data[all_data["R&D Incident"].isna()]
+    # 分为设置过 SS 的和没设置过 SS 的
+    ss_data_os = all_data_os[all_data_os["Suggested_Solution_Date"].notna()]
+    ns_data_os = all_data_os[all_data_os["Suggested_Solution_Date"].isna()]
+    if len(ss_data_os) != 0 or len(ns_data_os) != 0:
+        # SS 相关的时间, 按照日期计算相差的天数, 使用整数累加, timedelta64[ns] 累加大量数据时会溢出
+        dtr_ss_os = (ss_data_os["Suggested_Solution_Date"].dt.normalize() - ss_data_os["Date/Time Opened"].dt.normalize()).dt.days
+        # 非 SS 的时间
+        dtr_ns_os = ns_data_os["Age (Days)"]
+        # 计算 DTR
+        dtr_avg_os = (dtr_ss_os.sum() + dtr_ns_os.sum()) / len(all_data)
+        dtr_avg_os = str(round(dtr_avg_os, 2))
+        summary_data["DTR Support only"] = dtr_avg_os
+        show_debug("Cases_by_DTR_only_Support.csv", rawcase, all_data_os.index, columns=["Case Owner", "Case Number", "Status", "Date/Time Opened", "Suggested_Solution_Date", "R&D Incident", "Age (Days)"], debug=debug)
+    else:
+        summary_data["DTR Support only"] = "-"
+    return summary_data
+
+
+def case_report(rawcase, year, month, current_month, debug=None):
+    """
+    计算指定月份 cases 相关的 KPI
+    :param rawcase: cases 数据
+    :param year:
+    :param month:
+    :param current_month: 是否为当月, 只有当月才会计算 Backlog 相关的百分比和 DTR
+    :param debug: debug 数据的记录列表, 为 None 时不记录
+    :return: KPI 字典, 按照报告的顺序排列
+    """
+    summary_data = {}
+    # 根据年份和月份筛选数据
+    open_cases_y = rawcase[rawcase["Date/Time Opened"].dt.year == year]
+    open_cases_m = open_cases_y[open_cases_y["Date/Time Opened"].dt.month == month]
+    close_cases_y = rawcase[rawcase["Date/Time Closed"].dt.year == year]
+    close_cases_m = close_cases_y[close_cases_y["Date/Time Closed"].dt.month == month]
+    backlog, backlog_history = backlog_cases(rawcase, year, month)
     backlog_total = pd.concat([backlog, backlog_history])
     # KCS 相关
     kcs_all = close_cases_m[close_cases_m["Knowledge Base Article"].notna() | close_cases_m["Idol Knowledge Link"].notna()]
-    show_debug("Cases_by_KCS.csv", kcs_all, columns=["Case Owner", "Case Number", "Status", "Knowledge Base Article", "Idol Knowledge Link"])
+    show_debug("Cases_by_KCS.csv", rawcase, kcs_all.index, columns=["Case Owner", "Case Number", "Status", "Knowledge Base Article", "Idol Knowledge Link"], debug=debug)
     # 分析数据并得出结果
-    summary_data.append(["Open Cases", len(open_cases_m)])
-    summary_data.append(["Close Cases", len(close_cases_m)])
-    show_debug("Cases_by_Open_on_month.csv", open_cases_m, columns=["Case Owner", "Case Number", "Status", "Date/Time Opened"])
-    show_debug("Cases_by_Close_on_month.csv", close_cases_m, columns=["Case Owner", "Case Number", "Status", "Date/Time Opened", "Date/Time Closed"])
+    summary_data["Open Cases"] = len(open_cases_m)
+    summary_data["Close Cases"] = len(close_cases_m)
+    show_debug("Cases_by_Open_on_month.csv", rawcase, open_cases_m.index, columns=["Case Owner", "Case Number", "Status", "Date/Time Opened"], debug=debug)
+    show_debug("Cases_by_Close_on_month.csv", rawcase, close_cases_m.index, columns=["Case Owner", "Case Number", "Status", "Date/Time Opened", "Date/Time Closed"], debug=debug)
     # Closure Rate
     if len(open_cases_m) != 0:
-        summary_data.append(["Closure Rate", (str(round(len(close_cases_m) / len(open_cases_m) * 100, 2)) + "%")])
+        summary_data["Closure Rate"] = str(round(len(close_cases_m) / len(open_cases_m) * 100, 2)) + "%"
     else:
-        summary_data.append(["Closure Rate", "-"])
+        summary_data["Closure Rate"] = "-"
     # R&D Assist Rate
     if len(close_cases_m) != 0:
-        summary_data.append(["R&D Assist Rate", str(round(len(close_cases_m[close_cases_m["R&D Incident"].notna()]) / len(close_cases_m) * 100, 2)) + "%"])
-        show_debug("Cases_by_R&D_Incident.csv", close_cases_m[close_cases_m["R&D Incident"].notna()], columns=["Case Owner", "Case Number", "Status", "Date/Time Opened", "Date/Time Closed", "R&D Incident"])
+        summary_data["R&D Assist Rate"] = str(round(len(close_cases_m[close_cases_m["R&D Incident"].notna()]) / len(close_cases_m) * 100, 2)) + "%"
+        show_debug("Cases_by_R&D_Incident.csv", rawcase, close_cases_m[close_cases_m["R&D Incident"].notna()].index, columns=["Case Owner", "Case Number", "Status", "Date/Time Opened", "Date/Time Closed", "R&D Incident"], debug=debug)
     else:
-        summary_data.append(["R&D Assist Rate", "-"])
+        summary_data["R&D Assist Rate"] = "-"
     # Backlog
-    summary_data.append(["Backlog", len(backlog_total)])
-    show_debug("Cases_by_Backlog.csv", backlog_total, columns=["Case Owner", "Case Number", "Status", "Date/Time Opened"])
+    summary_data["Backlog"] = len(backlog_total)
+    show_debug("Cases_by_Backlog.csv", rawcase, backlog_total.index, columns=["Case Owner", "Case Number", "Status", "Date/Time Opened"], debug=debug)
     # Backlog 相关百分比的计算
     # 必须是当月才会计算, 并且 backlog 的值要求大于 0
-    if month_offset == 0 and (len(backlog_total)) >= 0:
+    if current_month and (len(backlog_total)) >= 0:
         # Backlog > 30 的比例
-        backlog30_percentage = str(round(len(backlog[backlog["Age (Days)"] > 30.0]) / (len(backlog) + len(backlog_history)) * 100, 2)) + "%"
-        show_debug("Cases_by_Backlog_ge_30.csv", backlog[backlog["Age (Days)"] > 30.0], columns=["Case Owner", "Case Number", "Status", "Date/Time Opened", "Age (Days)"])
-        summary_data.append(["Backlog > 30", backlog30_percentage])
+        backlog30_percentage = percent(len(backlog[backlog["Age (Days)"] > 30.0]), len(backlog) + len(backlog_history))
+        show_debug("Cases_by_Backlog_ge_30.csv", rawcase, backlog[backlog["Age (Days)"] > 30.0].index, columns=["Case Owner", "Case Number", "Status", "Date/Time Opened", "Age (Days)"], debug=debug)
+        summary_data["Backlog > 30"] = backlog30_percentage
         # Backlog > 30 并且没有升级的比例
         backlog30_no_cpe = backlog[backlog["Age (Days)"] > 30.0]
         backlog30_no_cpe = backlog30_no_cpe[backlog30_no_cpe["R&D Incident"].isna()]
-        show_debug("Cases_by_Backlog_ge_30_noCPE.csv", backlog30_no_cpe, columns=["Case Owner", "Case Number", "Status", "Date/Time Opened", "Age (Days)"])
-        backlog_30_no_cpe = str(round(len(backlog30_no_cpe) / (len(backlog) + len(backlog_history)) * 100, 2)) + "%"
-        summary_data.append(["Backlog > 30 (Support)", backlog_30_no_cpe])
+        show_debug("Cases_by_Backlog_ge_30_noCPE.csv", rawcase, backlog30_no_cpe.index, columns=["Case Owner", "Case Number", "Status", "Date/Time Opened", "Age (Days)"], debug=debug)
+        backlog_30_no_cpe = percent(len(backlog30_no_cpe), len(backlog) + len(backlog_history))
+        summary_data["Backlog > 30 (Support)"] = backlog_30_no_cpe
         # Backlog > 90 的比例
-        backlog90_percentage = str(round(len(backlog[backlog["Age (Days)"] > 90.0]) / (len(backlog) + len(backlog_history)) * 100, 2)) + "%"
-        show_debug("Cases_by_Backlog_ge_90.csv", backlog[backlog["Age (Days)"] > 90.0], columns=["Case Owner", "Case Number", "Status", "Date/Time Opened", "Age (Days)"])
-        summary_data.append(["Backlog > 90", backlog90_percentage])
-        # DTR 计算
-        # 未关闭的 case, 分为设置过 SS 和未设置过 SS
-        ssdata_bl_ss = backlog[backlog["Suggested_Solution_Date"].notna()]
-        ssdata_bl_noss = backlog[backlog["Suggested_Solution_Date"].isna()]
-        # 当月开的 case, 分为设置过 SS 和未设置过 SS
-        ssdata_mo_ss = open_cases_m[open_cases_m["Suggested_Solution_Date"].notna()]
-        ssdata_mo_noss = open_cases_m[open_cases_m["Suggested_Solution_Date"].isna()]
-        # 合并所有数据并去重
-        all_data = pd.concat([ssdata_bl_ss, ssdata_bl_noss, ssdata_mo_ss, ssdata_mo_noss])
-        all_data.sort_values(by=["Case Number"], ascending=False)
-        all_data.drop_duplicates(subset="Case Number")
-        # 基于是否设置过 SS 来拆分数据, 此时已经不存在重复的数据了
-        ss_data = all_data[all_data["Suggested_Solution_Date"].notna()]
-        ns_data = all_data[all_data["Suggested_Solution_Date"].isna()]
-        if len(ss_data) != 0 or len(ns_data) != 0:
-            dtr_ss_data = pd.DataFrame()
-            # SS 相关的时间
-            dtr_ss_data["Date/Time Opened"] = pd.to_datetime(ss_data["Date/Time Opened"]).dt.date
-            dtr_ss_data["Suggested_Solution_Date"] = pd.to_datetime(ss_data["Suggested_Solution_Date"]).dt.date
-            dtr_ss = dtr_ss_data["Suggested_Solution_Date"] - dtr_ss_data["Date/Time Opened"]
-            # 非 SS 的时间
-            dtr_ns = ns_data["Age (Days)"]
-            # 计算 DTR
-            dtr_avg = (dtr_ss.sum().days + dtr_ns.sum()) / len(all_data)
-            dtr_avg = str(round(dtr_avg, 2))
-            summary_data.append(["DTR", dtr_avg])
-            show_debug("Cases_by_DTR.csv", all_data, columns=["Case Owner", "Case Number", "Status", "Date/Time Opened", "Suggested_Solution_Date", "R&D Incident", "Age (Days)"])
-        else:
-            summary_data.append(["DTR", "-"])
-        # DTR only Support
-        all_data_os = all_data[all_data["R&D Incident"].isna()]
-        # 分为设置过 SS 的和没设置过 SS 的
-        ss_data_os = all_data_os[all_data_os["Suggested_Solution_Date"].notna()]
-        ns_data_os = all_data_os[all_data_os["Suggested_Solution_Date"].isna()]
-        if len(ss_data_os) != 0 or len(ns_data_os) != 0:
-            dtr_ss_data_os = pd.DataFrame()
-            # SS 相关的时间
-            dtr_ss_data_os["Date/Time Opened"] = pd.to_datetime(ss_data_os["Date/Time Opened"]).dt.date
-            dtr_ss_data_os["Suggested_Solution_Date"] = pd.to_datetime(ss_data_os["Suggested_Solution_Date"]).dt.date
-            dtr_ss_os = dtr_ss_data_os["Suggested_Solution_Date"] - dtr_ss_data_os["Date/Time Opened"]
-            # 非 SS 的时间
-            dtr_ns_os = ns_data_os["Age (Days)"]
-            # 计算 DTR
-            dtr_avg_os = (dtr_ss_os.sum().days + dtr_ns_os.sum()) / len(all_data)
-            dtr_avg_os = str(round(dtr_avg_os, 2))
-            summary_data.append(["DTR Support only", dtr_avg_os])
-            show_debug("Cases_by_DTR_only_Support.csv", all_data_os, columns=["Case Owner", "Case Number", "Status", "Date/Time Opened", "Suggested_Solution_Date", "R&D Incident", "Age (Days)"])
-        else:
-            summary_data.append(["DTR Support only", "-"])
+        backlog90_percentage = percent(len(backlog[backlog["Age (Days)"] > 90.0]), len(backlog) + len(backlog_history))
+        show_debug("Cases_by_Backlog_ge_90.csv", rawcase, backlog[backlog["Age (Days)"] > 90.0].index, columns=["Case Owner", "Case Number", "Status", "Date/Time Opened", "Age (Days)"], debug=debug)
+        summary_data["Backlog > 90"] = backlog90_percentage
+        summary_data.update(dtr_report(rawcase, backlog, open_cases_m, debug))
     else:
-        summary_data.append(["Backlog > 30", "-"])
-        summary_data.append(["Backlog > 30 (Support)", "-"])
-        summary_data.append(["Backlog > 90", "-"])
-        summary_data.append(["DTR", "-"])
+        summary_data["Backlog > 30"] = "-"
+        summary_data["Backlog > 30 (Support)"] = "-"
+        summary_data["Backlog > 90"] = "-"
+        summary_data["DTR"] = "-"
     # Backlog Index
     if len(open_cases_m) != 0:
-        summary_data.append(["Backlog Index", str(round(len(backlog) / len(open_cases_m) * 100, 2)) + "%"])
+        summary_data["Backlog Index"] = str(round(len(backlog) / len(open_cases_m) * 100, 2)) + "%"
     else:
-        summary_data.append(["Backlog Index", "-"])
+        summary_data["Backlog Index"] = "-"
     # KCS Linkage
     if len(close_cases_m) != 0:
-        summary_data.append(["KCS Linkage", str(round(len(kcs_all) / len(close_cases_m) * 100, 2)) + "%"])
+        summary_data["KCS Linkage"] = str(round(len(kcs_all) / len(close_cases_m) * 100, 2)) + "%"
     else:
-        summary_data.append(["KCS Linkage", "-"])
+        summary_data["KCS Linkage"] = "-"
     # Escalated
     if len(open_cases_m) != 0:
-        summary_data.append(["Escalated", str(len(open_cases_m[open_cases_m.Escalated != 0]))])
-        show_debug("Cases_by_Escalated.csv", open_cases_m[open_cases_m.Escalated != 0], columns=["Case Owner", "Case Number", "Status", "Date/Time Opened", "Escalated"])
-
-# 分析 Survey Report
-if report_survy is None:
-    print("[WARN] Survey report miss columns, will ignore.")
-else:
-    rawsurv = pd.read_csv(report_survy, encoding="utf-8", encoding_errors='ignore')
-    # 数据预处理
-    rawsurv["Customer Feed Back Survey: Last Modified Date"] = pd.to_datetime(rawsurv["Customer Feed Back Survey: Last Modified Date"], format="%Y-%m-%d")
-    # rawsurv["Closed Data"] = pd.to_datetime(rawsurv["Closed Data"], format="%Y-%m-%d")
-    rawsurv = rawsurv.sort_values(by=["Customer Feed Back Survey: Last Modified Date", ], ascending=False)
-    rawsurv = rawsurv.drop_duplicates(subset="Case Number")
+        summary_data["Escalated"] = str(len(open_cases_m[open_cases_m.Escalated != 0]))
+        show_debug("Cases_by_Escalated.csv", rawcase, open_cases_m[open_cases_m.Escalated != 0].index, columns=["Case Owner", "Case Number", "Status", "Date/Time Opened", "Escalated"], debug=debug)
+    return summary_data
+
+
+def survey_report(rawsurv, year, month, close_cases=0, debug=None):
+    """
+    计算指定月份 survey 相关的 KPI
+    :param rawsurv: survey 数据 (已按照 Case Number 去重)
+    :param year:
+    :param month:
+    :param close_cases: 当月关闭的 case 数量, 用于计算 Survey Response Rate, 为 0 时不计算
+    :param debug: debug 数据的记录列表, 为 None 时不记录
+    :return: KPI 字典, 按照报告的顺序排列
+    """
+    summary_data = {}
     # 根据年份和月份筛选数据
-    survey_y = rawsurv[rawsurv["Customer Feed Back Survey: Last Modified Date"].dt.year == y_offset]
-    survey_m = survey_y[survey_y["Customer Feed Back Survey: Last Modified Date"].dt.month == m_offset]
+    survey_y = rawsurv[rawsurv["Customer Feed Back Survey: Last Modified Date"].dt.year == year]
+    survey_m = survey_y[survey_y["Customer Feed Back Survey: Last Modified Date"].dt.month == month]
     survey_ces = survey_m[(survey_m["OpenText made it easy to handle my case"] >= 8.0) | (survey_m["OpenText made it easy to handle my case"].isna())]
     survey_cast = survey_m[(survey_m["Satisfied with support experience"] >= 8.0) | (survey_m["Satisfied with support experience"].isna())]
     # Survey CES & Survey CAST
     if len(survey_m) > 0:
-        summary_data.append(["Survey CES", str(round(len(survey_ces) / len(survey_m) * 100, 2)) + "%"])
-        summary_data.append(["Survey CAST", str(round(len(survey_cast) / len(survey_m) * 100, 2)) + "%"])
-        show_debug("Survey_CES_ge_8_by_month.csv", survey_ces, columns=["Case Owner", "Case Number", "OpenText made it easy to handle my case"])
-        show_debug("Survey_CAST_ge_8_by_month.csv", survey_ces, columns=["Case Owner", "Case Number", "Satisfied with support experience"])
+        summary_data["Survey CES"] = str(round(len(survey_ces) / len(survey_m) * 100, 2)) + "%"
+        summary_data["Survey CAST"] = str(round(len(survey_cast) / len(survey_m) * 100, 2)) + "%"
+        show_debug("Survey_CES_ge_8_by_month.csv", rawsurv, survey_ces.index, columns=["Case Owner", "Case Number", "OpenText made it easy to handle my case"], debug=debug)
+        show_debug("Survey_CAST_ge_8_by_month.csv", rawsurv, survey_ces.index, columns=["Case Owner", "Case Number", "Satisfied with support experience"], debug=debug)
     else:
-        summary_data.append(["Survey CES", "-"])
-        summary_data.append(["Survey CAST", "-"])
+        summary_data["Survey CES"] = "-"
+        summary_data["Survey CAST"] = "-"
     # SRR (Survey Response Rate)
-    if len(survey_m) > 0 and clos_cases_by_month is not None:
-        summary_data.append(["Survey Response Rate", str(round(len(survey_m) / len(clos_cases_by_month) * 100, 2)) + "%"])
+    if len(survey_m) > 0 and close_cases != 0:
+        summary_data["Survey Response Rate"] = str(round(len(survey_m) / close_cases * 100, 2)) + "%"
     else:
-        summary_data.append(["Survey Response Rate", "-"])
+        summary_data["Survey Response Rate"] = "-"
+    return summary_data
+
+
+def month_report(rawcase, rawsurv, year, month, current_month, debug=None):
+    """
+    计算指定月份的所有 KPI, 已经读取的数据可以重复用于计算多个月份
+    :param rawcase: cases 数据, 为 None 时不计算 cases 相关的 KPI
+    :param rawsurv: survey 数据 (已按照 Case Number 去重), 为 None 时不计算 survey 相关的 KPI
+    :param year:
+    :param month:
+    :param current_month: 是否为当月, 只有当月才会计算 Backlog 相关的百分比和 DTR
+    :param debug: debug 数据的记录列表, 为 None 时不记录
+    :return: KPI 字典, 按照报告的顺序排列
+    """
+    summary_data = {}
+    if rawcase is not None:
+        summary_data.update(case_report(rawcase, year, month, current_month, debug))
+    if rawsurv is not None:
+        summary_data.update(survey_report(rawsurv, year, month, summary_data.get("Close Cases", 0), debug))
+    return summary_data
 
-# 将结果写入到文件中
-if report_cases is not None or report_survy is not None:
-    output_file = "{}-{}".format(str(y_offset), str(m_offset)) + ".csv"
-    df = pd.DataFrame(summary_data, columns=summary_data[0])
-    df.to_csv(output_file, index=False, header=["KPI", "{}-{}".format(str(y_offset), str(m_offset))])
 
-    # 打印结果
-    table.add_rows(summary_data)
+def save_report(summary_data, year, month, folder="."):
+    """
+    将单月的 KPI 写入到 <year>-<month>.csv 中
+    :param summary_data: KPI 字典
+    :param year:
+    :param month:
+    :param folder: 输出的目录
+    :return: 输出的文件名
+    """
+    output_file = os.path.join(folder, "{}-{}".format(str(year), str(month)) + ".csv")
+    df = pd.DataFrame(list(summary_data.items()))
+    # 先写入临时文件再替换, 读取报告的程序不会读到写了一半的文件
+    df.to_csv(output_file + ".tmp", index=False, header=["KPI", "{}-{}".format(str(year), str(month))])
+    os.replace(output_file + ".tmp", output_file)
+    return output_file
+
+
+def show_table(pdata, index_label):
+    """
+    打印结果
+    :param pdata: pandas 数据, 行索引为第一列
+    :param index_label: 第一列的表头
+    :return:
+    """
+    table = PrettyTable()
+    table.field_names = [index_label] + [str(x) for x in pdata.columns]
+    table.add_rows([[index] + list(values) for index, values in zip(pdata.index, pdata.values)])
     print(table)
+
+
+def watch_reports(args_dict, folder="."):
+    """
+    监控目录中的报告, 报告变化后只重新读取变化的报告, 只重新计算受影响的 KPI
+    :param args_dict: 参数字典
+    :param folder: 报告所在的目录
+    :return:
+    """
+    month_offset = args_dict["month_offset"]
+    interval = args_dict["watch_interval"]
+    seen = report_state(folder)
+    kinds = {}
+    loaded_cases = None
+    loaded_survy = None
+    rawcase = None
+    rawsurv = None
+    case_data = None
+    surv_data = None
+    current = None
+    print("[INFO] Watching {} every {}s, press Ctrl+C to stop.".format(os.path.abspath(folder), interval))
+    try:
+        while True:
+            state = report_state(folder)
+            # 只处理两次轮询之间没有变化的报告, 避免读取正在写入的报告, 正在写入时继续使用之前的数据
+            for path, st in state.items():
+                if seen.get(path) == st and (path not in kinds or kinds[path][0] != st):
+                    # 报告可能在两次轮询之间被删除或锁定, 下次轮询再重试
+                    try:
+                        kinds[path] = (st,) + report_type(path)
+                    except Exception as e:
+                        print("[WARN] Read report header failed, will retry: {}".format(e))
+            for path in list(kinds):
+                if path not in state:
+                    del kinds[path]
+            seen = state
+            report_cases = None
+            report_survy = None
+            for path, kind in kinds.items():
+                if kind[1]:
+                    report_cases = (path, kind[0])
+                if kind[2]:
+                    report_survy = (path, kind[0])
+
+            # 只重新读取变化的报告, 读取失败时下次轮询再重试
+            changed = []
+            begin = time.time()
+            try:
+                if report_cases != loaded_cases:
+                    rawcase = load_cases(report_cases[0], args_dict["use_cache"], args_dict["cache_dir"]) if report_cases is not None else None
+                    loaded_cases = report_cases
+                    case_data = None
+                    changed.append("cases")
+                if report_survy != loaded_survy:
+                    rawsurv = load_surveys(report_survy[0], args_dict["use_cache"], args_dict["cache_dir"]) if report_survy is not None else None
+                    loaded_survy = report_survy
+                    surv_data = None
+                    changed.append("survey")
+            except Exception as e:
+                print("[WARN] Load report failed, will retry: {}".format(e))
+            # 月份变化时 (例如跨月), 重新计算所有的 KPI
+            y_offset, m_offset = offset_month(month_offset)
+            if (y_offset, m_offset) != current:
+                current = (y_offset, m_offset)
+                case_data = None
+                surv_data = None
+                changed.append("month")
+
+            if changed and (rawcase is not None or rawsurv is not None):
+                debug = [] if args_dict["debug"] else None
+                thread = None
+                # 计算或写入失败时 (例如导出的报告不完整) 保留之前的结果, 报告再次变化时重新计算
+                try:
+                    # 只有 cases 报告变化时才重新计算 cases 相关的 KPI, survey 相关的 KPI 依赖当月关闭的 case 数量
+                    if case_data is None:
+                        case_data = case_report(rawcase, y_offset, m_offset, month_offset == 0, debug) if rawcase is not None else {}
+                        surv_data = None
+                    if surv_data is None:
+                        surv_data = survey_report(rawsurv, y_offset, m_offset, case_data.get("Close Cases", 0), debug) if rawsurv is not None else {}
+                    summary_data = dict(case_data, **surv_data)
+                    thread = save_debug(debug, os.path.join(folder, "debug"), args_dict["debug_zip"], background=True)
+                    output_file = save_report(summary_data, y_offset, m_offset, folder)
+                    print("[INFO] {} updated in {}s, changed: {}".format(output_file, round(time.time() - begin, 2), ", ".join(changed)))
+                    show_table(pd.DataFrame({"{}-{}".format(str(y_offset), str(m_offset)): list(summary_data.values())}, index=list(summary_data.keys())), "KPI")
+                except Exception as e:
+                    print("[WARN] Update report failed, will retry when the reports change: {}".format(e))
+                finally:
+                    if thread is not None:
+                        thread.join()
+            elif changed:
+                print("[WARN] Case report and survey report miss columns, will ignore.")
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        print("[INFO] Watch stopped.")
+
+
+def check_args(input_args):
+    """
+    检查输入的参数
+    :param input_args: 命令行参数, 不包含脚本名
+    :return: 参数字典
+    """
+    args_dict = {
+        "month_offset": 0,
+        "debug": False,
+        "debug_zip": False,
+        "use_cache": True,
+        "cache_dir": os.path.join(".", "cache"),
+        "range_months": 0,
+        "by_owner": False,
+        "stream_rows": 0,
+        "watch_interval": 0,
+    }
+    # 定义偏移量, 如果不写默认是 0
+    # noinspection PyBroadException
+    try:
+        args_dict["month_offset"] = int(input_args[0])
+    except:
+        args_dict["month_offset"] = 0
+    # 是否开启 debug / 是否使用缓存 / 缓存目录 / 趋势模式的月份数量 / 是否按照 Case Owner 统计 / 分块读取的行数 / 监控的轮询间隔
+    for index, key in enumerate(input_args):
+        if key == "-debug":
+            args_dict["debug"] = True
+        if key == "-debug-zip":
+            args_dict["debug"] = True
+            args_dict["debug_zip"] = True
+        if key == "-owner":
+            args_dict["by_owner"] = True
+        if key == "-no-cache":
+            args_dict["use_cache"] = False
+        if key == "-cache-dir" and index + 1 < len(input_args):
+            args_dict["cache_dir"] = input_args[index + 1]
+        if key == "-range":
+            # noinspection PyBroadException
+            try:
+                args_dict["range_months"] = int(input_args[index + 1])
+            except:
+                args_dict["range_months"] = 0
+        if key == "-stream":
+            # noinspection PyBroadException
+            try:
+                args_dict["stream_rows"] = int(input_args[index + 1])
+            except:
+                args_dict["stream_rows"] = DEFAULT_STREAM_ROWS
+        if key == "-watch":
+            # noinspection PyBroadException
+            try:
+                args_dict["watch_interval"] = float(input_args[index + 1])
+            except:
+                args_dict["watch_interval"] = DEFAULT_WATCH_INTERVAL
+    return args_dict
+
+
+def main(input_args=None):
+    """
+    命令行入口
+    :param input_args: 命令行参数, 不包含脚本名, 默认为 sys.argv[1:]
+    :return:
+    """
+    if input_args is None:
+        input_args = sys.argv[1:]
+    args_dict = check_args(input_args)
+    # 监控模式, 报告变化后自动更新单月的结果
+    if args_dict["watch_interval"] > 0:
+        watch_reports(args_dict)
+        return
+    month_offset = args_dict["month_offset"]
+    y_offset, m_offset = offset_month(month_offset)
+    report_cases, report_survy = detect_reports()
+    if report_cases is None:
+        print("[WARN] Case report miss columns, will ignore.")
+    if report_survy is None:
+        print("[WARN] Survey report miss columns, will ignore.")
+    if report_cases is None and report_survy is None:
+        return
+
+    # 分块模式, 不再一次读取整个报告, 适用于非常大的报告
+    if args_dict["stream_rows"] > 0:
+        if args_dict["debug"]:
+            print("[WARN] Debug output is not available in stream mode, will ignore.")
+        summary_data = stream_report(report_cases, report_survy, y_offset, m_offset, month_offset == 0, args_dict["stream_rows"])
+        save_report(summary_data, y_offset, m_offset)
+        show_table(pd.DataFrame({"{}-{}".format(str(y_offset), str(m_offset)): list(summary_data.values())}, index=list(summary_data.keys())), "KPI")
+        return
+
+    # 只读取需要的列, 并完成时间的预处理
+    rawcase = None
+    rawsurv = None
+    if report_cases is not None:
+        rawcase = load_cases(report_cases, args_dict["use_cache"], args_dict["cache_dir"])
+    if report_survy is not None:
+        rawsurv = load_surveys(report_survy, args_dict["use_cache"], args_dict["cache_dir"])
+
+    # 趋势模式 / 按照 Case Owner 统计时, 使用分组一次计算所有的结果, 不再逐个月份/逐个负责人筛选数据
+    if args_dict["range_months"] > 0 or args_dict["by_owner"]:
+        # 趋势模式, 计算截止到指定月份的多个月份的 KPI, 写入到一个文件中
+        if args_dict["range_months"] > 0:
+            trend_months = pd.period_range(end=pd.Period(year=y_offset, month=m_offset, freq="M"), periods=args_dict["range_months"], freq="M")
+            trend_data = trend_report(rawcase, rawsurv, trend_months)
+            trend_data.to_csv("trend_{}_{}.csv".format(trend_data.columns[0], trend_data.columns[-1]), index_label="KPI")
+            show_table(trend_data, "KPI")
+        # 按照 Case Owner 统计指定月份的 KPI, 写入到一个文件中
+        if args_dict["by_owner"]:
+            owner_data = owner_report(rawcase, rawsurv, y_offset, m_offset, month_offset == 0)
+            owner_data.to_csv("{}-{}_by_owner.csv".format(str(y_offset), str(m_offset)), index_label="Case Owner")
+            show_table(owner_data, "Case Owner")
+        return
+
+    # 将结果写入到文件中, debug 数据在后台线程中统一输出
+    debug = [] if args_dict["debug"] else None
+    summary_data = month_report(rawcase, rawsurv, y_offset, m_offset, month_offset == 0, debug)
+    thread = save_debug(debug, archive=args_dict["debug_zip"], background=True)
+    save_report(summary_data, y_offset, m_offset)
+    show_table(pd.DataFrame({"{}-{}".format(str(y_offset), str(m_offset)): list(summary_data.values())}, index=list(summary_data.keys())), "KPI")
+    if thread is not None:
+        thread.join()
+
+
+if __name__ == "__main__":
+    main()